@@ -0,0 +1,328 @@
+#!/usr/bin/python
+# benchmark the Compute and Data hot paths and check them against a recorded baseline
+# 10/18/26
+
+import os
+import sys
+import json
+import shutil
+import signal
+import logging
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import datasets
+from timeit import default_timer
+from data import Data
+from compute import Compute
+from schedule import compile_schedule
+from plan import load_plan
+from stepperweblib import StepperControl
+from emulator import EmulatorServer, Controller
+
+
+basepath = os.path.dirname(os.path.realpath(__file__))
+default_baseline = os.path.join(basepath, 'bench.json')
+default_tolerance = 0.25  # fail if a benchmark is more than 25% slower than its baseline
+
+# (name, setup, number, repeat) for every benchmark, see benchmark()
+benchmarks = []
+
+
+class Timeout(Exception):
+    pass
+
+
+def benchmark(name, number=1, repeat=3):
+    '''
+    register a setup function as a benchmark. setup is called once and returns
+    the function to time, which is called number times per repeat. the best
+    repeat is kept, as seconds per call. setup can also return (function,
+    teardown), teardown is called once timing is done, even if it timed out.
+    '''
+    def register(setup):
+        benchmarks.append((name, setup, number, repeat))
+        return setup
+
+    return register
+
+
+def write_synthetic_data(path, num_rows):
+    '''write a csv shaped like the ones in data/ with num_rows of a noisy rising curve'''
+    x = np.arange(num_rows) + 1950
+    y = 4 + np.linspace(0, 3, num_rows)**2 + np.random.RandomState(0).normal(0, 0.1, num_rows)
+    np.savetxt(path, np.column_stack([x, y]), delimiter=',', header='year,value', comments='', fmt=['%d', '%.6f'])
+
+
+def steps_per_inches(compute, steps_completed, calculate):
+    '''time a 4 inch bite starting from steps_completed'''
+    def run():
+        compute.update_position(steps_completed)
+        calculate(inches_to_move=Compute.max_inches_per_move)
+
+    return run
+
+
+@benchmark('compute.steps_per_inches.outer', number=1000)
+def bench_steps_outer(tempdir):
+    compute = Compute(target_diameter=Compute.core_diameter)
+    return steps_per_inches(compute, 0, compute.calculate_steps_per_inches)
+
+
+@benchmark('compute.steps_per_inches.inner', number=1000)
+def bench_steps_inner(tempdir):
+    compute = Compute(target_diameter=Compute.core_diameter)
+    return steps_per_inches(compute, int(compute.total_steps_to_complete) - 10000, compute.calculate_steps_per_inches)
+
+
+@benchmark('compute.steps_per_inches_stepwise.outer', number=10)
+def bench_steps_stepwise_outer(tempdir):
+    compute = Compute(target_diameter=Compute.core_diameter)
+    return steps_per_inches(compute, 0, compute.calculate_steps_per_inches_stepwise)
+
+
+@benchmark('compute.steps_per_inches_stepwise.inner', number=10)
+def bench_steps_stepwise_inner(tempdir):
+    compute = Compute(target_diameter=Compute.core_diameter)
+    return steps_per_inches(compute, int(compute.total_steps_to_complete) - 10000, compute.calculate_steps_per_inches_stepwise)
+
+
+@benchmark('compute.update_sim.10000')
+def bench_update_sim(tempdir):
+    compute = Compute(target_diameter=Compute.core_diameter)
+
+    def run():
+        for i in range(10000):
+            compute.update_sim()
+
+    return run
+
+
+def data_init(path):
+    return lambda: Data(data_path=path)
+
+
+for art, path in sorted(Data.paths.items()):
+    benchmark('data.init.{}'.format(art), number=10)(lambda tempdir, path=path: data_init(path))
+
+
+for num_rows in (10**5, 10**6):
+    def bench_data_synthetic(tempdir, num_rows=num_rows):
+        path = os.path.join(tempdir, 'synthetic-{}.csv'.format(num_rows))
+        write_synthetic_data(path, num_rows)
+        return data_init(path)
+
+    benchmark('data.init.synthetic.{}'.format(num_rows), repeat=1)(bench_data_synthetic)
+
+
+@benchmark('schedule.compile.all_portions')
+def bench_compile_schedule(tempdir):
+    data = Data(data_path=Data.paths['sea'])
+    return lambda: compile_schedule(data, Compute(target_diameter=Compute.diameter_after_half_paper_moved))
+
+
+@benchmark('schedule.compile.resampled')
+def bench_compile_resampled(tempdir):
+    data = Data(data_path=Data.paths['sea'])
+    return lambda: compile_schedule(data, Compute(target_diameter=Compute.diameter_after_half_paper_moved), resample='linear')
+
+
+@benchmark('data.resample.1000000', number=1)
+def bench_resample(tempdir):
+    data = Data(data_path=Data.paths['sea'])
+    return lambda: data.resample(10**6, Compute.max_inches_per_move * 10**6)
+
+
+@benchmark('plan.resume.sea', number=100)
+def bench_resume(tempdir):
+    '''open an up to date plan and put the roll back where the last portion left it'''
+    plan_path = os.path.join(tempdir, 'plan-resume.bin')
+    load_plan(plan_path, 'sea', Data.paths['sea']).close()
+    compute = Compute(target_diameter=Compute.diameter_after_half_paper_moved)
+
+    def run():
+        plan = load_plan(plan_path, 'sea', Data.paths['sea'])
+        start = plan.find_next(plan[-1].position - 1)
+        compute.update_position(plan[start - 1].steps_completed)
+        plan.close()
+
+    return run
+
+
+@benchmark('main.import', number=5)
+def bench_main_import(tempdir):
+    '''start python and import main.py and everything it imports up front, see main.py --startup-times'''
+    return lambda: subprocess.check_call([sys.executable, '-c', 'import main'], cwd=basepath)
+
+
+def copy_tree(tempdir):
+    '''
+    copy the code, log.yaml and data/ to tempdir, so a main.py run from there
+    writes its plan and log next to the copy instead of into the repo
+    '''
+    tree = os.path.join(tempdir, 'tree')
+    os.mkdir(tree)
+    for name in os.listdir(basepath):
+        if name.endswith('.py') or name == 'log.yaml':
+            shutil.copy(os.path.join(basepath, name), tree)
+    shutil.copytree(datasets.basepath, os.path.join(tree, 'data'))
+
+    return tree
+
+
+def bench_main_sim(tempdir, sim_args):
+    '''a whole main.py sim run on a copy of the tree, with a fresh move.db each time'''
+    tree = copy_tree(tempfile.mkdtemp(dir=tempdir))
+    # compiled up front, like a plan left by the last run
+    load_plan(os.path.join(tree, 'plan-sea.bin'), 'sea', os.path.join(tree, 'data', os.path.basename(datasets.paths['sea']))).close()
+
+    def run():
+        rundir = tempfile.mkdtemp(dir=tempdir)
+        with open(os.path.join(rundir, 'config.yml'), 'w') as config:
+            config.write('feed_ip: 127.0.0.1\neat_ip: 127.0.0.1\nart: sea\nfeed_dir: -1\n')
+        with open(os.devnull, 'w') as devnull:
+            process = subprocess.Popen([sys.executable, os.path.join(tree, 'main.py')] + sim_args, cwd=rundir, stdout=devnull, stderr=devnull)
+            try:
+                process.wait()
+            finally:
+                # don't leave main.py running if the benchmark timed out
+                if process.poll() is None:
+                    process.kill()
+
+    return run
+
+
+# one bite at a time, and the whole schedule at once, see main.simulate_plan()
+benchmark('main.sim.sea', repeat=1)(lambda tempdir: bench_main_sim(tempdir, ['--sim']))
+benchmark('main.sim_to.sea', repeat=3)(lambda tempdir: bench_main_sim(tempdir, ['--sim-to', 'sim-sea.npz']))
+
+
+@benchmark('stepper.move.emulated', number=20)
+def bench_emulated_move(tempdir):
+    '''one move, wait and halt against an emulated controller, i.e. the protocol overhead of a bite'''
+    server = EmulatorServer(('127.0.0.1', 0), Controller(time_scale=1000)).start()
+    control = StepperControl(server.host)
+
+    def run():
+        control.move_relative(250, -500)
+        while not control.check_reached():
+            pass
+        control.halt()
+
+    def teardown():
+        control.close()
+        server.stop()
+
+    return run, teardown
+
+
+def run_tests():
+    '''run the test suite in tests/, see README. returns True if it passed'''
+    return subprocess.call([sys.executable, '-m', 'pytest', '-q', os.path.join(basepath, 'tests')]) == 0
+
+
+def _raise_timeout(signum, frame):
+    raise Timeout()
+
+
+def run_benchmark(setup, number, repeat, tempdir, timeout):
+    '''return best seconds per call, or None if the benchmark ran past timeout seconds'''
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.alarm(timeout)
+
+    teardown = None
+    try:
+        run = setup(tempdir)
+        if isinstance(run, tuple):
+            run, teardown = run
+        best = None
+        for i in range(repeat):
+            start = default_timer()
+            for j in range(number):
+                run()
+            elapsed = (default_timer() - start) / number
+            best = elapsed if best is None else min(best, elapsed)
+    except Timeout:
+        best = None
+    finally:
+        signal.alarm(0)
+        if teardown:
+            teardown()
+
+    return best
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare(name, seconds, baseline, tolerance):
+    '''
+    return a status for a result against its baseline: ok, slower, new or timeout.
+    a timeout only counts as slower if the baseline finished in time.
+    '''
+    if seconds is None:
+        return 'timeout' if baseline.get(name) is None else 'slower'
+    if baseline.get(name) is None:
+        return 'new'
+    if seconds > baseline[name] * (1 + tolerance):
+        return 'slower'
+
+    return 'ok'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='bench.py')
+    parser.add_argument('--baseline', default=default_baseline, help='json file of baseline results')
+    parser.add_argument('--record', action='store_true', help='save these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, help='allowed slowdown as a fraction of the baseline, i.e. 0.25')
+    parser.add_argument('--timeout', type=int, default=300, help='seconds before a benchmark is abandoned')
+    parser.add_argument('--only', help='only run benchmarks with this in their name')
+    parser.add_argument('--check', action='store_true', help='run the tests first, see tests/')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    baseline = load_baseline(args.baseline)
+    tolerance = args.tolerance if args.tolerance is not None else baseline.get('tolerance', default_tolerance)
+    results = {}
+    failed = []
+    tempdir = tempfile.mkdtemp()
+
+    if args.check and not run_tests():
+        shutil.rmtree(tempdir)
+        sys.exit(1)
+
+    try:
+        for name, setup, number, repeat in benchmarks:
+            if args.only and args.only not in name:
+                continue
+
+            seconds = run_benchmark(setup, number, repeat, tempdir, args.timeout)
+            status = compare(name, seconds, baseline.get('results', {}), tolerance)
+            results[name] = seconds
+            if status == 'slower':
+                failed.append(name)
+
+            print('{:<45} {:>14} {:>14}  {}'.format(
+                name,
+                'timeout' if seconds is None else '{:.6f}s'.format(seconds),
+                '{:.6f}s'.format(baseline['results'][name]) if baseline.get('results', {}).get(name) is not None else '-',
+                status,
+            ))
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(tempdir)
+
+    if args.record:
+        recorded = dict(baseline.get('results', {}), **results)
+        with open(args.baseline, 'w') as f:
+            json.dump({'tolerance': tolerance, 'results': recorded}, f, indent=2, sort_keys=True)
+        print('baseline saved to {}'.format(args.baseline))
+    elif failed:
+        print('{} benchmark(s) slower than baseline by more than {:.0%}: {}'.format(len(failed), tolerance, ', '.join(failed)))
+        sys.exit(1)
@@ -5,9 +5,13 @@
 # 4/15/18
 # updated 9/3/18
 
+import os
 import logging
+import argparse
 from math import pi
 from datetime import datetime
+from lazy import lazy, invalidate
+from profiling import phases
 
 
 class Compute:
@@ -52,19 +56,42 @@ class Compute:
         why target_diameter defaults to initial_diameter / 2
         '''
         self.logger = self._init_logger()
-        self.target_diameter = target_diameter
-        self.target_radius = target_diameter / 2
+        self.set_target_diameter(target_diameter)
         self.steps_completed = 0
         self.total_inches_moved = 0
         self.num_revs_completed = self.get_num_revs_completed()
         self.current_radius = self.get_current_radius()
         self.current_circumference = self.get_current_circumference()
         self.inches_per_step = self.get_inches_per_step()
-        self.total_revs_to_complete = self.get_total_num_revs(self.target_radius)
-        self.total_steps_to_complete = self.get_total_num_steps()
-        self.total_num_layers = self.get_total_num_layers()
-        self.total_linear_inches = self.get_total_linear_inches()
-        self.total_inches_to_move = self.total_linear_inches / 2  # move exactly half the paper on the roll
+
+    # totals for the whole roll are only worked out when something reads them.
+    # they're always measured from the full roll, however far it has moved since
+
+    @lazy
+    def total_revs_to_complete(self):
+        return self.get_total_num_revs(self.target_radius, start_radius=self.initial_radius)
+
+    @lazy
+    def total_steps_to_complete(self):
+        return self.get_total_num_steps()
+
+    @lazy
+    def total_num_layers(self):
+        return self.get_total_num_layers(start_radius=self.initial_radius)
+
+    @lazy
+    def total_linear_inches(self):
+        return self.get_total_linear_inches()
+
+    @lazy
+    def total_inches_to_move(self):
+        return self.total_linear_inches / 2  # move exactly half the paper on the roll
+
+    def set_target_diameter(self, target_diameter):
+        '''change where the roll stops, the totals that depend on it are recomputed when next read'''
+        self.target_diameter = target_diameter
+        self.target_radius = target_diameter / 2
+        invalidate(self)
 
     def _init_logger(self):
         logger = logging.getLogger('compute')
@@ -100,21 +127,23 @@ class Compute:
         '''
         return self.current_circumference / self.steps_per_revolution
 
-    def get_total_num_revs(self, target_radius):
+    def get_total_num_revs(self, target_radius, start_radius=None):
         '''
         total number of revolutions to complete should be the difference between
         the starting radius and target radius divided by the width of the paper.
         if we set radius_end to core_radius, this is equivalent to
         the # of nested concentric circles that the roll contains.
+        start_radius defaults to the current radius.
         '''
-        return (self.current_radius - target_radius) / self.paper_thickness
+        start_radius = self.current_radius if start_radius is None else start_radius
+        return (start_radius - target_radius) / self.paper_thickness
 
-    def get_total_num_layers(self):
+    def get_total_num_layers(self, start_radius=None):
         '''
         total # of layers - or nested concentric circles - of paper on the roll
         is equal to the # of revolutions required to unravel the roll
         '''
-        return self.get_total_num_revs(target_radius=self.core_radius)
+        return self.get_total_num_revs(target_radius=self.core_radius, start_radius=start_radius)
 
     def get_total_num_steps(self):
         '''
@@ -133,14 +162,145 @@ class Compute:
         average_radius = (self.initial_radius + self.core_radius) / 2
         average_layer_length = self.calculate_circumference(average_radius)
 
-        return self.get_total_num_layers() * average_layer_length
+        return self.total_num_layers * average_layer_length
 
     def calculate_circumference(self, radius):
         '''C = 2πr = πd'''
         return 2 * pi * radius
 
+    def calculate_inches_per_steps(self, steps_completed):
+        '''
+        closed form of the linear inches of paper moved after some # of steps.
+        step j moves the inches_per_step of the radius after j steps, so the sum
+        over the first n steps is an arithmetic series:
+
+        (2π / steps_per_rev) * (n * initial_radius - thickness * n(n - 1) / (2 * steps_per_rev))
+
+        steps_completed can be a single number or a numpy array of them
+        '''
+        n = steps_completed * 1.0
+        radius_sum = n * self.initial_radius - self.paper_thickness * n * (n - 1) / (2 * self.steps_per_revolution)
+
+        return 2 * pi * radius_sum / self.steps_per_revolution
+
+    def _solve_steps_completed(self, target_inches):
+        '''
+        invert calculate_inches_per_steps() with the quadratic formula to estimate
+        the # of steps completed at which target_inches of paper have moved.
+        target_inches can be a single number or a numpy array of them
+        '''
+        a = pi * self.paper_thickness / self.steps_per_revolution**2
+        b = 2 * pi * (self.initial_radius + self.paper_thickness / (2 * self.steps_per_revolution)) / self.steps_per_revolution
+        discriminant = b**2 - 4 * a * target_inches
+        # max(discriminant, 0) that works on arrays too
+        discriminant = discriminant * (discriminant > 0)
+
+        return 2 * target_inches / (b + discriminant**0.5)
+
+    def _calculate_steps_completed(self, starting_steps, target_inches):
+        '''
+        return the first # of steps completed, no less than starting_steps, at which
+        more than target_inches of paper have moved. the quadratic gets us within
+        a step of the answer, the loops settle any floating point rounding.
+        '''
+        steps = max(starting_steps, int(self._solve_steps_completed(target_inches)) + 1)
+
+        while self.calculate_inches_per_steps(steps) <= target_inches:
+            steps += 1
+        while steps > starting_steps and self.calculate_inches_per_steps(steps - 1) > target_inches:
+            steps -= 1
+
+        return steps
+
+    def update_position(self, steps_completed):
+        '''move the roll to steps_completed and recompute everything that depends on it'''
+        self.restore(steps_completed, self.calculate_inches_per_steps(steps_completed))
+
+    def restore(self, steps_completed, total_inches_moved):
+        '''
+        put the roll back exactly where a checkpoint left it, i.e. sqltrack.Tracker.get_last_bite(),
+        without stepping through everything that was moved before it
+        '''
+        self.steps_completed = steps_completed
+        self.total_inches_moved = total_inches_moved
+        self.num_revs_completed = self.get_num_revs_completed()
+        self.current_radius = self.get_current_radius()
+        self.current_circumference = self.get_current_circumference()
+        self.inches_per_step = self.get_inches_per_step()
+
     def calculate_steps_per_inches(self, inches_to_move=max_inches_per_move):
-        '''calculate # of steps to move some # of inches'''
+        '''
+        calculate # of steps to move some # of inches. returns the same # of steps
+        as calculate_steps_per_inches_stepwise(), but in constant time
+        '''
+        starting_steps = self.steps_completed
+        target_inches = self.total_inches_moved + inches_to_move
+
+        if self.total_inches_moved <= target_inches:
+            self.update_position(self._calculate_steps_completed(starting_steps, target_inches))
+
+        return self.steps_completed - starting_steps
+
+    def _settle_steps_completed(self, starting_steps, target_inches):
+        '''_calculate_steps_completed() for numpy arrays of starting_steps and target_inches'''
+        steps = self._solve_steps_completed(target_inches).astype(starting_steps.dtype) + 1
+        behind = steps < starting_steps
+        steps[behind] = starting_steps[behind]
+
+        while True:
+            short = self.calculate_inches_per_steps(steps) <= target_inches
+            if not short.any():
+                break
+            steps += short
+        while True:
+            over = (steps > starting_steps) & (self.calculate_inches_per_steps(steps - 1) > target_inches)
+            if not over.any():
+                break
+            steps -= over
+
+        return steps
+
+    def calculate_steps_per_bites(self, bites):
+        '''
+        batch version of calculate_steps_per_inches(). bites is a list or array of
+        inches to move, eaten in order. returns a numpy array of # of steps per bite.
+
+        every bite starts from the inches its last step actually reached, so each
+        bite's steps depend on all the bites before it. they're first estimated
+        from the running total of inches, then every bite is solved again from
+        where the bites before it ended, until no bite changes. a bite's steps
+        hardly ever depend on where it starts, so that takes a pass or two, and
+        the steps are the same as calling calculate_steps_per_inches() per bite.
+        '''
+        # only compiling a schedule needs numpy, see schedule.py
+        import numpy as np
+
+        bites = np.asarray(bites, dtype=float)
+        starting_steps = self.steps_completed
+        ends = self._solve_steps_completed(self.total_inches_moved + np.cumsum(bites)).astype(np.int64) + 1
+        steps = np.diff(np.concatenate([[starting_steps], np.maximum.accumulate(np.maximum(ends, starting_steps))]))
+
+        while len(bites):
+            starts = starting_steps + np.concatenate([[0], np.cumsum(steps[:-1])])
+            start_inches = self.calculate_inches_per_steps(starts)
+            start_inches[0] = self.total_inches_moved
+            target_inches = start_inches + bites
+
+            # a bite that doesn't move forward takes no steps
+            solved = np.where(start_inches <= target_inches, self._settle_steps_completed(starts, target_inches) - starts, 0)
+            if (solved == steps).all():
+                break
+            steps = solved
+
+        self.update_position(starting_steps + int(steps.sum()))
+
+        return steps
+
+    def calculate_steps_per_inches_stepwise(self, inches_to_move=max_inches_per_move):
+        '''
+        calculate # of steps to move some # of inches one step at a time.
+        reference implementation for calculate_steps_per_inches()
+        '''
         starting_steps = self.steps_completed
         target_inches = self.total_inches_moved + inches_to_move
 
@@ -220,7 +380,10 @@ class Compute:
         self.inches_per_step = self.get_inches_per_step()
 
     def run_simulation(self):
-        '''debug purposes only'''
+        '''
+        debug purposes only. steps through the roll one step at a time, this is
+        the reference for the much faster simulate.run_simulation()
+        '''
         start = datetime.now()
 
         for i in range(int(self.total_steps_to_complete)):
@@ -236,5 +399,35 @@ class Compute:
 
 
 if __name__ == '__main__':
-    push = Compute(target_diameter=Compute.core_diameter)
-    push.run_simulation()
+    parser = argparse.ArgumentParser(prog='compute.py')
+    parser.add_argument('--reference', action='store_true', help='simulate one step at a time, printing every step')
+    parser.add_argument('--sample-every', type=int, default=0, help='keep the state of the roll every N steps')
+    parser.add_argument('--trace', help='csv file to write the sampled states to')
+    parser.add_argument('--chunk-size', type=int, default=1000000, help='# of steps simulated at once')
+    parser.add_argument('--profile', action='store_true', help='run under cProfile, see profiling.py')
+    args = parser.parse_args()
+
+    if args.profile:
+        from profiling import Profiler, get_profile_paths
+        profiler = Profiler(*get_profile_paths(os.path.dirname(os.path.realpath(__file__)), 'compute')).start()
+
+    with phases.phase('compute setup'):
+        push = Compute(target_diameter=Compute.core_diameter)
+
+    if args.reference:
+        with phases.phase('simulation'):
+            push.run_simulation()
+    else:
+        # the chunked simulation needs numpy, which the rest of this module does not
+        from simulate import run_simulation, save_samples, print_simulation
+
+        with phases.phase('simulation'):
+            simulation = run_simulation(push, sample_every=args.sample_every, chunk_size=args.chunk_size)
+        if args.trace:
+            save_samples(args.trace, simulation.samples)
+
+        push.print_totals()
+        print_simulation(simulation)
+
+    if args.profile:
+        print('profile written to {} and {}'.format(*profiler.stop()))
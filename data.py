@@ -3,18 +3,51 @@
 # 4/16/18
 # updated 9/3/18
 
-import csv
+import os
 import logging
+import itertools
 import numpy as np
+import datasets
+from lazy import lazy, invalidate
+
+
+def discrete_integrals(y):
+    '''array of the area under each unit of x, the same as np.trapz on each pair of points'''
+    y = np.asarray(y, dtype=float)
+    return (y[1:] + y[:-1]) / 2.0
+
+
+def running_total(datapoints, start=0.0):
+    '''start plus the sum of datapoints, added one at a time like sum(); pairwise np.sum() rounds differently'''
+    return np.cumsum(np.concatenate([[start], np.asarray(datapoints, dtype=float)]))[-1]
+
+
+def percentages(datapoints, total=None):
+    '''array of each datapoint as a fraction of total, which defaults to their sum'''
+    datapoints = np.asarray(datapoints, dtype=float)
+    if len(datapoints) == 0:
+        return datapoints
+
+    return datapoints / (running_total(datapoints) if total is None else total)
+
+
+def normalize(datapoints):
+    '''array of datapoints normalized between 0.0 - 1.0'''
+    datapoints = np.asarray(datapoints, dtype=float)
+    data_min = datapoints.min()
+    return (datapoints - data_min) / (datapoints.max() - data_min)
+
+
+def translate_range(normalized, new_min=-1.0, new_max=1.0):
+    '''array of normalized datapoints translated to between new_min and new_max'''
+    return new_min + (np.asarray(normalized, dtype=float) * (new_max - new_min))
 
 
 class Data:
 
-    paths = {
-        'sea': '/home/pi/gitbucket/scroll/data/sea_level_rise.csv',
-        'hot': '/home/pi/gitbucket/scroll/data/avg_hottest_day.csv',
-        'precip': '/home/pi/gitbucket/scroll/data/precip_lowest_3_years_inches.csv'
-    }
+    # see datasets.py
+    basepath = datasets.basepath
+    paths = datasets.paths
 
     def __init__(self, data_path=paths['sea']):
         self.logger = self._init_logger()
@@ -22,8 +55,8 @@ class Data:
         self.original_data = self._load_data()
         self.data = self._parse_data()
         self.x, self.y = self.data[:,0], self.data[:,1]
-        self.f = self._estimate_function()
         self.integrals = self._compute_discrete_integrals()
+        self.total = running_total(self.integrals)
         self.percents = self.calculate_percentages(datapoints=self.integrals)
         # self.normalized_data = self._normalize_data()
 
@@ -33,21 +66,66 @@ class Data:
 
         return logger
 
+    def _get_cache_path(self):
+        return '{}.cache.npy'.format(self.data_path)
+
+    def _get_cache_key(self):
+        '''mtime and size of the csv, a cache is only good for the file it was made from'''
+        stat = os.stat(self.data_path)
+        return (stat.st_mtime, stat.st_size)
+
+    def _load_cache(self, key):
+        '''
+        return the cached (x, y) array memory-mapped from disk, or None if there is
+        no cache or it was made from a different version of the csv. the first row
+        of the cache holds the key, the rest are the datapoints.
+        '''
+        try:
+            cache = np.load(self._get_cache_path(), mmap_mode='r')
+        except (IOError, ValueError):
+            return None
+
+        if cache.ndim != 2 or len(cache) == 0 or tuple(cache[0]) != key:
+            return None
+
+        return cache[1:]
+
+    def _save_cache(self, key, data):
+        '''write data to the cache through a temp file, or log why not if the data directory is read-only'''
+        cache_path = self._get_cache_path()
+        temp_path = '{}.tmp'.format(cache_path)
+
+        try:
+            with open(temp_path, 'wb') as f:
+                np.save(f, np.vstack([key, data]))
+            os.rename(temp_path, cache_path)
+        except (IOError, OSError) as e:
+            self.logger.warning('could not write data cache {}: {}'.format(cache_path, e))
+
     def _load_data(self):
-        '''return list of tuples with entries formatted as (x, y)'''
-        self.logger.info('loading data from {}'.format(self.data_path))
+        '''return numpy array of rows formatted as (x, y), parsing the csv only if its cache is out of date'''
+        key = self.cache_key = self._get_cache_key()
+        data = self._load_cache(key)
+        if data is not None:
+            self.logger.info('loading data from {}'.format(self._get_cache_path()))
+            return data
 
-        with open(self.data_path, 'r') as sheet:
-            reader = csv.reader(sheet)
-            next(reader, None)  # skip the header
+        self.logger.info('loading data from {}'.format(self.data_path))
+        # any columns past x and y are ignored
+        data = np.loadtxt(self.data_path, delimiter=',', skiprows=1, ndmin=2, usecols=(0, 1))
+        self._save_cache(key, data)
 
-            return [(float(row[0]), float(row[1])) for row in reader]
+        return data
 
     def _parse_data(self):
         '''reset x-axis to between 0 and len(data) - 1 and represent data as numpy array'''
         self.logger.info('resetting x-axis to 0 - (len(data) - 1) and converting to numpy array')
-        new_data = [(i, self.original_data[i][1]) for i in range(len(self.original_data))]
-        return np.array(new_data)
+        return np.column_stack([np.arange(len(self.original_data), dtype=float), self.original_data[:, 1]])
+
+    @lazy
+    def f(self):
+        '''the polynomial fitted to the datapoints, only fitted when something reads it'''
+        return self._estimate_function()
 
     def _estimate_function(self, degree=3):
         '''
@@ -65,20 +143,17 @@ class Data:
         the sum of the list is equal to the total area under the curve.
         '''
         self.logger.info('computing dicrete integrals between the datapoints')
-        return [np.trapz([self.y[i], self.y[i + 1]], dx=1) for i in range(len(self.y)) if i < len(self.y) - 1]
+        return list(discrete_integrals(self.y))
 
     def calculate_percentages(self, datapoints):
         '''return list of percentages of each y datapoint of the total y dataset'''
         self.logger.info('calculating the percentages of discrete integrals to total integral')
-        return [datapoints[i] / sum(datapoints) for i in range(len(datapoints))]
+        return list(percentages(datapoints))
 
     def normalize_data(self, datapoints):
         '''return list of datapoints normalized between 0.0 - 1.0'''
         self.logger.info('normalizing the datapoints')
-        data_min = min(datapoints)
-        data_range = max(datapoints) - data_min
-
-        return [(n - data_min) / data_range for n in datapoints]
+        return list(normalize(datapoints))
 
     def translate(self, new_min=-1.0, new_max=1.0):
         '''
@@ -86,7 +161,98 @@ class Data:
         defaults to a range of -1.0 to 1.0
         '''
         self.logger.info('translating normalized datapoints to new range of {} - {}'.format(new_min, new_max))
-        return [new_min + (n * (new_max - new_min)) for n in self.normalized_data]
+        return list(translate_range(self.normalized_data, new_min, new_max))
+
+    def integrate_to(self, x, method='linear'):
+        '''
+        array of the area under the curve from 0 to each x. method 'linear' joins
+        the datapoints with straight lines, the same curve the discrete integrals
+        measure; 'poly' integrates the fitted polynomial, see _estimate_function().
+        '''
+        x = np.clip(np.asarray(x, dtype=float), 0, len(self.y) - 1)
+        if method == 'poly':
+            area = self.f.integ()
+            return area(x) - area(0)
+        if method != 'linear':
+            raise ValueError('unknown resampling method {}'.format(method))
+
+        # area up to the start of each unit of x, plus the trapezoid into it
+        cumulative = np.concatenate([[0.0], np.cumsum(self.integrals)])
+        i = np.minimum(np.floor(x).astype(int), len(self.y) - 2)
+        t = x - i
+        slope = self.y[i + 1] - self.y[i]
+
+        return cumulative[i] + t * self.y[i] + t * t / 2 * slope
+
+    def resample(self, num_movements, total_inches, method='linear'):
+        '''
+        split the area under the whole curve into num_movements equal slices of x
+        and return how many inches to move for each, as a float array that adds up
+        to total_inches. unlike meals, every movement gets its own size.
+        '''
+        self.logger.info('resampling {} datapoints to {} movements'.format(len(self.y), num_movements))
+        edges = self.integrate_to(np.linspace(0, len(self.y) - 1, num_movements + 1), method=method)
+        inches = np.diff(edges) * (total_inches / (edges[-1] - edges[0]))
+
+        # so adding the movements up one at a time lands exactly on total_inches
+        inches[-1] = total_inches - running_total(inches[:-1])
+
+        return inches
+
+    def append(self, x, y):
+        '''
+        add new datapoints to the end of the dataset. only the integrals between
+        the new points are computed, and they are added on to the running total,
+        so integrals, total and percents come out exactly as if the whole dataset
+        had been loaded at once. percents are then rescaled in one pass, since
+        every one of them shifts when the total does. returns # of points added.
+        see schedule.meal_delta() for what that does to the meals.
+        '''
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        y = np.atleast_1d(np.asarray(y, dtype=float))
+        if len(y) == 0:
+            return 0
+
+        self.logger.info('appending {} datapoints to {}'.format(len(y), self.data_path))
+        first = len(self.y)
+        self.original_data = np.vstack([self.original_data, np.column_stack([x, y])])
+        self.data = np.vstack([self.data, np.column_stack([np.arange(first, first + len(y), dtype=float), y])])
+        self.x, self.y = self.data[:,0], self.data[:,1]
+        invalidate(self, 'f')
+
+        # the first new integral is between the last old point and the first new one
+        new_integrals = discrete_integrals(self.y[max(first - 1, 0):])
+        self.integrals.extend(new_integrals)
+        self.total = running_total(new_integrals, start=self.total)
+        self.percents = list(percentages(self.integrals, total=self.total))
+
+        return len(y)
+
+    def refresh(self):
+        '''
+        append rows that were added to the end of the csv since it was loaded.
+        the csv is assumed to only ever grow at the end. returns # of rows added.
+        '''
+        # taken before reading, so rows added while we read only make the
+        # cache look out of date, never up to date when it isn't
+        key = self._get_cache_key()
+        if key == self.cache_key:
+            return 0
+
+        with open(self.data_path, 'r') as sheet:
+            # skip the header and the rows we already have
+            lines = list(itertools.islice(sheet, 1 + len(self.original_data), None))
+
+        lines = [line for line in lines if line.strip()]
+        self.cache_key = key
+        if not lines:
+            return 0
+
+        rows = np.loadtxt(lines, delimiter=',', ndmin=2, usecols=(0, 1))
+        added = self.append(rows[:, 0], rows[:, 1])
+        self._save_cache(key, self.original_data)
+
+        return added
 
     def print_data(self):
         for datapoint in self.original_data:
@@ -0,0 +1,14 @@
+#!/usr/bin/python
+# where the dataset for each art piece lives, readable without importing numpy
+# 10/18/26
+
+import os
+
+
+# absolute paths for the systemd service; on the pi these resolve to /home/pi/gitbucket/scroll/data
+basepath = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data')
+paths = {
+    'sea': os.path.join(basepath, 'sea_level_rise.csv'),
+    'hot': os.path.join(basepath, 'avg_hottest_day.csv'),
+    'precip': os.path.join(basepath, 'precip_lowest_3_years_inches.csv')
+}
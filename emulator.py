@@ -0,0 +1,378 @@
+#!/usr/bin/python
+# emulate a Nanotec N5 motor controller's REST API on localhost for load and latency testing
+# 10/18/26
+
+import time
+import random
+import logging
+import argparse
+import threading
+import SocketServer
+import BaseHTTPServer
+
+
+class Controller:
+    '''
+    object dictionary and motion state of one emulated N5 controller. only the
+    registers stepperweblib.StepperControl touches are modelled:
+
+    - ControlWord 0x6040 walks the CiA 402 state machine, 0x06 -> 0x07 -> 0x0F.
+      bit 4 going high while operation is enabled starts a move of TargetPosition
+      steps (relative if bit 6 is set), dropping back to switched on (0x07)
+      cancels it and bit 8 halts it where it is.
+    - StatusWord 0x6041 reports the state, with bit 10 set once a move is done.
+    - a move takes as long as the real motor would at ProfileVelocity 0x6081
+      revolutions per minute, scaled by time_scale to run faster than real time.
+    - ActualPosition 0x6064 follows the move as it goes.
+    - Inputs 0x60FD bit 16 is the limit switch, clear while it is engaged. by
+      default it engages once a move has gone limit_after steps; set
+      limit_switch to True or False to force it, or None to go back to moving.
+    '''
+
+    ControlWord = 0x6040
+    StatusWord = 0x6041
+    ProfileVelocity = 0x6081
+    TargetPosition = 0x607A
+    Inputs = 0x60FD
+    ActualPosition = 0x6064
+    OperatingMode = 0x6060
+    InputVoltageRange = 0x3240
+    ClosedLoop = 0x3202
+
+    # hex digits registers are read back with, and which of them are signed
+    widths = {ControlWord: 4, StatusWord: 4, ProfileVelocity: 8, TargetPosition: 8, Inputs: 8,
+              ActualPosition: 8, OperatingMode: 2, InputVoltageRange: 8, ClosedLoop: 4}
+    signed = (TargetPosition, ActualPosition)
+
+    # StatusWord for each state, before the target reached bit
+    switch_on_disabled = 0x0040
+    ready_to_switch_on = 0x0021
+    switched_on = 0x0023
+    operation_enabled = 0x0027
+    target_reached = 0x0400
+
+    limit_bit = 0x10000
+
+    def __init__(self, steps_per_revolution=25000, time_scale=1.0, limit_after=250):
+        self.steps_per_revolution = steps_per_revolution
+        self.time_scale = time_scale
+        self.limit_after = limit_after
+        self.limit_switch = None
+        self.lock = threading.Lock()
+        self.registers = {(self.ProfileVelocity, 0): 0, (self.TargetPosition, 0): 0,
+                          (self.OperatingMode, 0): 0, (self.ClosedLoop, 0): 0}
+        self.control = 0
+        self.state = self.switch_on_disabled
+        self.position = 0
+        # current move, (start time, start position, steps, seconds); None when stopped
+        self.move = None
+        self.moves = 0
+        self.move_start = None
+
+    def _update(self, now):
+        '''bring the actual position up to now, ending the move once it has run its course'''
+        if self.move is None:
+            return
+
+        started, start, steps, seconds = self.move
+        if now - started >= seconds:
+            self.position = start + steps
+            self.move = None
+        else:
+            self.position = start + int(steps * (now - started) / seconds)
+
+    def _start(self, now):
+        steps = self._get(self.TargetPosition)
+        if not self.control & 0x40:
+            steps -= self.position  # absolute move
+        rpm = max(self._get(self.ProfileVelocity), 1)
+        seconds = abs(steps) / float(self.steps_per_revolution) / rpm * 60 / self.time_scale
+        self.move = (now, self.position, steps, seconds)
+        self.move_start = self.position
+        self.moves += 1
+
+    def _get(self, index, subindex=0):
+        return self.registers.get((index, subindex), 0)
+
+    def _set_control(self, value, now):
+        command = value & 0x0F
+        if command == 0x06:
+            self.state = self.ready_to_switch_on
+        elif command == 0x07:
+            self.state = self.switched_on
+        elif command == 0x0F and self.state in (self.switched_on, self.operation_enabled):
+            self.state = self.operation_enabled
+        else:
+            self.state = self.switch_on_disabled
+
+        if self.state != self.operation_enabled or value & 0x100:
+            # anything but operation enabled, or halt, stops the motor where it is
+            self.move = None
+        elif value & 0x10 and not self.control & 0x10:
+            self._start(now)
+
+        self.control = value
+
+    def _limit_engaged(self):
+        if self.limit_switch is not None:
+            return self.limit_switch
+        if self.limit_after is None or self.move_start is None:
+            return False
+
+        # stays engaged after the move that engaged it, until the next one starts
+        return abs(self.position - self.move_start) >= self.limit_after
+
+    def read(self, index, subindex):
+        '''value of a register as the controller sends it, hex in quotes, or None if there is no such register'''
+        with self.lock:
+            self._update(time.time())
+            if index == self.StatusWord:
+                value = self.state | (0 if self.move else self.target_reached)
+            elif index == self.Inputs:
+                value = 0 if self._limit_engaged() else self.limit_bit
+            elif index == self.ActualPosition:
+                value = self.position
+            elif index == self.ControlWord:
+                value = self.control
+            elif (index, subindex) in self.registers:
+                value = self.registers[(index, subindex)]
+            else:
+                return None
+
+        width = self.widths.get(index, 8)
+
+        return '"{:0{}X}"'.format(value & (16**width - 1), width)
+
+    def write(self, index, subindex, body):
+        '''set a register from a request body like stepperweblib.StepperComms.make_value() sends'''
+        svalue = body.strip().strip('"')
+        value = int(svalue, 16)
+        if index in self.signed and value >= 2**(len(svalue) * 4 - 1):
+            value -= 2**(len(svalue) * 4)
+
+        with self.lock:
+            now = time.time()
+            self._update(now)
+            if index == self.ControlWord:
+                self._set_control(value, now)
+            else:
+                self.registers[(index, subindex)] = value
+
+
+class Faults:
+    '''
+    latency and failures to inject into every request. each request is delayed
+    by latency seconds plus up to jitter more, then fails with an HTTP 500 with
+    probability error_rate, or has its connection dropped without an answer with
+    probability drop_rate. go_down() makes the controller unreachable for a while.
+    '''
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, drop_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.down_until = 0
+
+    def go_down(self, seconds):
+        self.down_until = time.time() + seconds
+
+    def is_down(self):
+        return time.time() < self.down_until
+
+    def delay(self):
+        return self.latency + self.random.uniform(0, self.jitter)
+
+    def pick(self):
+        '''what to do with the next request: None to answer it, 'error' or 'drop' '''
+        if self.is_down():
+            return 'drop'
+        roll = self.random.random()
+        if roll < self.drop_rate:
+            return 'drop'
+        if roll < self.drop_rate + self.error_rate:
+            return 'error'
+
+        return None
+
+
+class Stats:
+    '''request counts and how long each request took to answer, latency included'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counts = {'GET': 0, 'POST': 0, 'error': 0, 'drop': 0, 'connections': 0}
+        self.durations = []
+
+    def add(self, kind, duration=None):
+        with self.lock:
+            self.counts[kind] += 1
+            if duration is not None:
+                self.durations.append(duration)
+
+    def percentile(self, fraction):
+        with self.lock:
+            durations = sorted(self.durations)
+        if not durations:
+            return 0.0
+
+        return durations[min(int(fraction * len(durations)), len(durations) - 1)]
+
+    def print_stats(self):
+        '''debug purposes only'''
+        elapsed = time.time() - self.started
+        answered = self.counts['GET'] + self.counts['POST']
+        print('connections: {}'.format(self.counts['connections']))
+        print('requests: {} GET, {} POST, {} errors, {} dropped'.format(
+            self.counts['GET'], self.counts['POST'], self.counts['error'], self.counts['drop']))
+        print('throughput: {:.1f} requests/s'.format(answered / elapsed if elapsed else 0.0))
+        for fraction in (0.5, 0.9, 0.99, 0.999):
+            print('p{:g}: {:.2f}ms'.format(fraction * 100, self.percentile(fraction) * 1000))
+
+
+class ControllerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''answers GET and POST on /od/XXXX/YY the way the controller's REST API does'''
+
+    # send each response in one go, or nagle holds it back for the client's delayed ack
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.protocol_version = self.server.protocol_version
+        self.server.stats.add('connections')
+
+    def _parse_path(self):
+        try:
+            od, index, subindex = self.path.strip('/').split('/')
+            if od != 'od':
+                raise ValueError(self.path)
+            return int(index, 16), int(subindex, 16)
+        except ValueError:
+            return None, None
+
+    def _handle(self, method):
+        started = time.time()
+        faults = self.server.faults
+        body = ''
+        if method == 'POST':
+            body = self.rfile.read(int(self.headers.getheader('content-length', 0)))
+
+        time.sleep(faults.delay())
+        fault = faults.pick()
+        if fault == 'drop':
+            self.server.stats.add('drop')
+            self.close_connection = 1
+            return
+
+        index, subindex = self._parse_path()
+        if fault == 'error':
+            self.server.stats.add('error')
+            return self._respond(500, '')
+        if index is None:
+            return self._respond(404, '')
+
+        controller = self.server.controller
+        if method == 'GET':
+            value = controller.read(index, subindex)
+            if value is None:
+                return self._respond(404, '')
+            self._respond(200, value)
+        else:
+            try:
+                controller.write(index, subindex, body)
+            except ValueError:
+                return self._respond(400, '')
+            self._respond(200, '')
+
+        self.server.stats.add(method, time.time() - started)
+
+    def _respond(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def log_message(self, format, *args):
+        self.server.logger.debug('%s - %s', self.address_string(), format % args)
+
+
+class EmulatorServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''
+    one emulated controller listening on address, a (host, port) tuple. point
+    StepperControl at it with a host like '127.0.0.1:8070'. set http10 to answer
+    like the real controller, which closes the connection after every request.
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, controller=None, faults=None, http10=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, ControllerHandler)
+        self.protocol_version = 'HTTP/1.0' if http10 else 'HTTP/1.1'
+        self.logger = logging.getLogger('emulator')
+        self.controller = controller or Controller()
+        self.faults = faults or Faults()
+        self.stats = Stats()
+        self.thread = None
+
+    @property
+    def host(self):
+        '''host string for StepperControl, i.e. '127.0.0.1:8070' '''
+        return '{}:{}'.format(*self.server_address)
+
+    def start(self):
+        '''serve on a background thread'''
+        self.thread = threading.Thread(target=self.serve_forever, name='emulator-{}'.format(self.host))
+        self.thread.daemon = True
+        self.thread.start()
+        self.logger.info('emulating controller at {}'.format(self.host))
+
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='emulator.py')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, action='append', help='port for each controller, i.e. --port 8070 --port 8071')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='run moves this many times faster than the real motor')
+    parser.add_argument('--limit-after', type=int, default=250, help='steps into a move before the limit switch engages')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many more seconds added at random')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 500')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='fraction of requests dropped without an answer')
+    parser.add_argument('--http10', action='store_true', help='close the connection after every request like the real controller')
+    parser.add_argument('--seed', type=int, help='seed for latency and failure injection')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    servers = []
+    for port in args.port or [8070, 8071]:
+        controller = Controller(time_scale=args.time_scale, limit_after=args.limit_after)
+        faults = Faults(args.latency, args.jitter, args.error_rate, args.drop_rate, args.seed)
+        servers.append(EmulatorServer((args.host, port), controller, faults, http10=args.http10).start())
+
+    print('emulating controllers at {}, ctrl-c to stop'.format(', '.join(server.host for server in servers)))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+
+    for server in servers:
+        print('* {}, {} moves'.format(server.host, server.controller.moves))
+        server.stats.print_stats()
+        server.stop()
@@ -0,0 +1,35 @@
+#!/usr/bin/python
+# attributes that are only computed when something reads them
+# 10/18/26
+
+
+class lazy(object):
+    '''
+    decorator for a method that computes a derived attribute. the method runs
+    the first time the attribute is read, and its result is cached on the
+    instance under the same name, so later reads are plain attribute lookups.
+    works on old-style classes too. see invalidate() for when inputs change.
+    '''
+
+    def __init__(self, func):
+        self.func = func
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        value = instance.__dict__[self.__name__] = self.func(instance)
+        return value
+
+
+def invalidate(instance, *names):
+    '''
+    forget the cached values of the lazy attributes in names, or of all of them
+    if no names are given, so they are computed again the next time they're read
+    '''
+    cls = instance.__class__
+    names = names or [name for name in dir(cls) if isinstance(getattr(cls, name, None), lazy)]
+    for name in names:
+        instance.__dict__.pop(name, None)
@@ -0,0 +1,183 @@
+#!/usr/bin/python
+# hand log records to a background thread so the motion loop never waits on the sd card
+# 10/18/26
+
+import time
+import Queue
+import logging
+import threading
+import traceback
+import logging.handlers
+
+
+class QueueHandler(logging.Handler):
+    '''
+    stands in for target on a logger. records are put on a queue as they are,
+    without formatting them, and a QueueListener passes them on to target
+    from its own thread. exception tracebacks are formatted right away, while
+    they still exist.
+    '''
+
+    def __init__(self, queue, target):
+        logging.Handler.__init__(self, target.level)
+        self.queue = queue
+        self.target = target
+
+    def emit(self, record):
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info)).rstrip('\n')
+            record.exc_info = None
+
+        self.queue.put_nowait((self.target, record))
+
+
+class BatchedFileHandler(logging.handlers.RotatingFileHandler):
+    '''
+    RotatingFileHandler that leaves flushing to whoever is writing to it, so a
+    QueueListener can write a whole batch of records with one flush
+    '''
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        self.acquire()
+        try:
+            if self.stream:
+                logging.handlers.RotatingFileHandler.flush(self)
+        finally:
+            self.release()
+
+
+class QueueListener:
+    '''
+    takes (handler, record) pairs off queue on a background thread and has each
+    handler handle its record. whatever has piled up on the queue is handled
+    as one batch of up to batch_size records, then handlers that can are
+    flushed once, see BatchedFileHandler.
+    '''
+
+    def __init__(self, queue, batch_size=100):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._listen, name='log-listener')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _listen(self):
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            flush = set()
+            for item in batch:
+                if item is None:
+                    stopping = True
+                    continue
+                handler, record = item
+                handler.handle(record)
+                if hasattr(handler, 'flush_batch'):
+                    flush.add(handler)
+
+            for handler in flush:
+                handler.flush_batch()
+
+    def stop(self):
+        '''handle everything already queued, then stop the thread'''
+        self.queue.put_nowait(None)
+        self.thread.join()
+
+
+class RateLimitFilter(logging.Filter):
+    '''
+    lets at most rate records a second through from each place in the code that
+    logs on each thread, with bursts of up to burst. the next record let through from that
+    place says how many were dropped in between. meant for messages logged
+    from polling loops; a quiet call site is never limited, and neither is
+    anything logged at level or above.
+    '''
+
+    def __init__(self, rate=10.0, burst=20, level=logging.WARNING):
+        logging.Filter.__init__(self)
+        self.rate = float(rate)
+        self.burst = burst
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+        # (pathname, lineno, thread) -> [tokens, last time, # dropped]
+        self.buckets = {}
+
+    def filter(self, record):
+        if record.levelno >= self.level:
+            return True
+
+        now = time.time()
+        bucket = self.buckets.setdefault((record.pathname, record.lineno, record.threadName), [self.burst, now, 0])
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+
+        if bucket[0] < 1:
+            bucket[2] += 1
+            return False
+
+        bucket[0] -= 1
+        if bucket[2]:
+            record.msg = '{} ({} similar messages dropped)'.format(record.msg, bucket[2])
+            bucket[2] = 0
+
+        return True
+
+
+class SampleFilter(logging.Filter):
+    '''
+    lets 1 in every every records through from each place in the code that logs.
+    anything logged at level or above always gets through
+    '''
+
+    def __init__(self, every=10, level=logging.WARNING):
+        logging.Filter.__init__(self)
+        self.every = every
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+        self.counts = {}
+
+    def filter(self, record):
+        if record.levelno >= self.level:
+            return True
+
+        key = (record.pathname, record.lineno)
+        count = self.counts[key] = self.counts.get(key, 0) + 1
+
+        return (count - 1) % self.every == 0
+
+
+def start_queue_logging(batch_size=100):
+    '''
+    move the handlers of the root logger and every configured logger behind a
+    queue, so logging a record only costs putting it on the queue. call after
+    logging.config.dictConfig(). returns the running QueueListener, stop it
+    before exiting to write out anything still queued.
+    '''
+    queue = Queue.Queue()
+    proxies = {}
+    loggers = [logging.getLogger()] + [logger for logger in logging.Logger.manager.loggerDict.values() if isinstance(logger, logging.Logger)]
+
+    for logger in loggers:
+        for handler in list(logger.handlers):
+            if handler not in proxies:
+                proxies[handler] = QueueHandler(queue, handler)
+                # filters on the handler run before a record is queued
+                proxies[handler].filters = handler.filters
+                handler.filters = []
+            logger.removeHandler(handler)
+            logger.addHandler(proxies[handler])
+
+    listener = QueueListener(queue, batch_size=batch_size)
+    listener.start()
+
+    return listener
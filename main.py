@@ -5,7 +5,13 @@
 # updated 9/3/18
 
 import os
+from startup import StartupTimer
+# starts counting from when the process did, see --startup-times
+startup_timer = StartupTimer()
+startup_timer.mark('python')
+
 import yaml
+import threading
 import logging
 import logging.config
 from socket import gethostname
@@ -13,12 +19,41 @@ from collections import namedtuple
 from datetime import datetime, timedelta
 import stepperweblib
 from wait import Wait
-from data import Data
+from motion import MotionTimer
+import datasets
 from compute import Compute
+from plan import load_plan
 import sys
 import time
 import sqltrack
 import argparse
+import atexit
+import metrics
+from profiling import phases
+startup_timer.mark('imports')
+
+# numpy, and everything that needs it, is only imported when the plan has to
+# be compiled or new data comes in, see load_plan() and absorb_new_data()
+
+# the C parser if pyyaml was built with libyaml, it's a lot faster on the pi
+YAMLLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# cycle times of each installation, labeled with its name, exported by
+# metricsexport.FileExporter or metricsexport.MetricsServer
+def feed_seconds(art):
+    return metrics.histogram('scroll_feed_paper_seconds', 'time for the feed motor to move one bite', art=art)
+
+
+def eat_seconds(art):
+    return metrics.histogram('scroll_eat_paper_seconds', 'time for the eat motor to find the limit switch', art=art)
+
+
+def eat_repeat_moves(art):
+    return metrics.counter('scroll_eat_repeat_moves_total', 'eat motor moves repeated because the limit switch was not engaged yet', art=art)
+
+
+def bite_seconds(art):
+    return metrics.histogram('scroll_bite_seconds', 'time to feed and eat one bite', art=art)
 
 
 def _get_logfile_name(basepath, hostname):
@@ -42,26 +77,38 @@ def get_hostname():
     return gethostname().split('.')[0]
 
 
-def configure_logger(basepath, hostname):
+def configure_logger(basepath, hostname, fleet=False):
+    # log.yaml names its handlers and filters from here, dictConfig needs it anyway
+    import logqueue
+
     with open(os.path.join(basepath, 'log.yaml'), 'r') as log_conf:
-        log_config = yaml.safe_load(log_conf)
+        log_config = yaml.load(log_conf, Loader=YAMLLoader)
+
+    if fleet:
+        # each installation runs on a thread named after it, see run_fleet()
+        for formatter in log_config['formatters'].values():
+            formatter['format'] = formatter['format'].replace('%(name)s', '%(name)s [%(threadName)s]')
 
     log_config['handlers']['file']['filename'] = _get_logfile_name(basepath, hostname)
     logging.config.dictConfig(log_config)
+    # the motion loop only puts records on a queue, a thread writes them out
+    atexit.register(logqueue.start_queue_logging().stop)
     logging.info('* * * * * * * * * * * * * * * * * * * *')
     logging.info('logging configured')
 
     return _init_logger()
 
 
-def initialize_motors(feed_ip=None, eat_ip=None, sim=0):
+Motors = namedtuple('Motors', ['feed', 'eat'])
+
+
+def initialize_motors(feed_ip=None, eat_ip=None, sim=0, liveness_ttl=5.0, http10=False, art=''):
     logger.info('''initializing motors''')
-    Motors = namedtuple('Motors', ['feed', 'eat'])
 
     if sim == 1:
         motors = Motors
     else:
-        init_motors = [stepperweblib.StepperControl(ip) for ip in [feed_ip, eat_ip]]
+        init_motors = [stepperweblib.StepperControl(ip, liveness_ttl=liveness_ttl, http10=http10) for ip in [feed_ip, eat_ip]]
         motors = Motors(feed=init_motors[0], eat=init_motors[1])
         for motor in motors:
             motor.halt()
@@ -69,56 +116,245 @@ def initialize_motors(feed_ip=None, eat_ip=None, sim=0):
         # check if limit switch is engaged on eat motor; eat paper if it's not
         if not motors.eat.check_flag():  # limit switch not engaged == 1
             logger.warning('limit switch not engaged upon initialization')
-            eat_paper(motors.eat)
+            eat_paper(motors.eat, art=art)
 
     return motors
 
 
-def feed_paper(motor, steps, speed=250, sim=0, dir=-1):
+def initialize_drivers(feed_ip, eat_ip, liveness_ttl=5.0, http10=False, art=''):
+    '''
+    same as initialize_motors(), but each controller gets its own worker thread,
+    see stepperweblib.AsyncStepperControl. both are brought up and halted at once.
+    '''
+    logger.info('''initializing motor drivers''')
+    drivers = Motors(*[stepperweblib.AsyncStepperControl(ip, liveness_ttl=liveness_ttl, http10=http10) for ip in [feed_ip, eat_ip]])
+    stepperweblib.gather(*[driver.ready for driver in drivers])
+    stepperweblib.gather(*[driver.halt() for driver in drivers])
+
+    # check if limit switch is engaged on eat motor; eat paper if it's not
+    if not drivers.eat.check_flag().result():  # limit switch not engaged == 1
+        logger.warning('limit switch not engaged upon initialization')
+        drivers.eat.submit(lambda: eat_paper(drivers.eat.control, art=art)).result()
+
+    return drivers
+
+
+def feed_paper(motor, steps, speed=250, sim=0, dir=-1, timer=None, art=''):
+    '''
+    move feed motor steps at speed. if timer is set, sleep through most of the
+    time the move should take instead of polling, see motion.MotionTimer. art
+    is the installation the metrics are labeled with
+    '''
     steps *= dir  # rotate 'backwards'
-    logger.info('moving feed motor {} steps at speed {}'.format(steps, speed))
+    # formatted by the log listener thread, not here, see logqueue.py
+    logger.info('moving feed motor %s steps at speed %s', steps, speed)
     if sim == 0:
-        motor.move_relative(speed, steps)
+        with feed_seconds(art).timer():
+            move_and_wait(motor, steps, speed, timer)
 
-        while True:
-            if motor.check_reached():
-                motor.halt()
-                logger.info('feed motor movement finished')
-                break
-            # need a delay
-            time.sleep(0.1)
 
+def move_and_wait(motor, steps, speed, timer=None):
+    '''move motor steps at speed and halt once it has reached its target, see feed_paper()'''
+    motor.move_relative(speed, steps)
 
-def eat_paper(motor, steps=500, speed=5, sim=0):
+    if timer:
+        timer.wait_until(motor.check_reached, steps, speed)
+        motor.halt()
+        logger.info('feed motor movement finished')
+        return
+
+    while True:
+        if motor.check_reached():
+            motor.halt()
+            logger.info('feed motor movement finished')
+            break
+        # need a delay
+        nap()
+
+
+def eat_paper(motor, steps=500, speed=5, sim=0, timer=None, art=''):
     '''
     move eat motor continuously until limit switch is engaged. steps defaults
-    to 1/50th of a revolution, or 500 steps. speed defaults to a conservative 2
+    to 1/50th of a revolution, or 500 steps. speed defaults to a conservative 2.
+    if timer is set, don't ask whether a move is finished before it should be.
     '''
-    logger.info('moving eat motor {} steps at speed {}'.format(steps, speed))
+    logger.info('moving eat motor %s steps at speed %s', steps, speed)
     if sim == 0:
-        motor.move_relative(speed, steps)
+        with eat_seconds(art).timer():
+            eat_until_engaged(motor, steps, speed, timer, art)
+
 
-        while True:
-            if motor.check_flag():  # limit switch engaged == 0
+def eat_until_engaged(motor, steps, speed, timer=None, art=''):
+    '''move motor steps at a time at speed until the limit switch engages, see eat_paper()'''
+    motor.move_relative(speed, steps)
+    finish_by = time.time() + timer.predict(steps, speed) if timer else 0
+
+    while True:
+        if motor.check_flag():  # limit switch engaged == 0
+            motor.halt()
+            logger.info('limit switch engaged, motor halted')
+            break
+        elif time.time() >= finish_by and motor.check_reached():
+            logger.info('eat motor movement finished but limit switch not engaged... repeating movement')
+            eat_repeat_moves(art).inc()
+            motor.move_relative(speed, steps)
+            finish_by = time.time() + timer.predict(steps, speed) if timer else 0
+        # need a delay
+        nap()
+
+
+def chase_paper(motor, fed, steps=500, speed=5, art=''):
+    '''
+    eat paper while the feed motor is still moving. the eat motor moves whenever
+    the limit switch lets go and halts when it engages, until fed is set and the
+    limit switch is engaged.
+    '''
+    logger.info('chasing feed motor with eat motor %s steps at a time at speed %s', steps, speed)
+    moving = False
+
+    while True:
+        if motor.check_flag():  # limit switch engaged == 0
+            if moving:
                 motor.halt()
+                moving = False
                 logger.info('limit switch engaged, motor halted')
+            if fed.is_set():
                 break
-            elif motor.check_reached():
-                logger.info('eat motor movement finished but limit switch not engaged... repeating movement')
-                motor.move_relative(speed, steps)
-            # need a delay
-            time.sleep(0.1)
+        elif not moving or motor.check_reached():
+            if moving:
+                eat_repeat_moves(art).inc()
+            motor.move_relative(speed, steps)
+            moving = True
+        # need a delay
+        nap()
+
+
+def feed_and_eat(drivers, steps, feed_speed, eat_speed, dir=-1, timer=None, art=''):
+    '''
+    feed_paper() and eat_paper() for one bite, with both controllers running at
+    the same time on their own worker threads
+    '''
+    fed = threading.Event()
+    feeding = drivers.feed.submit(feed_paper, drivers.feed.control, steps, feed_speed, 0, dir, timer, art)
+    eating = drivers.eat.submit(chase_paper, drivers.eat.control, fed, 500, eat_speed, art)
+
+    try:
+        feeding.result()
+    finally:
+        # stop chasing even if the feed motor failed
+        fed.set()
+    eating.result()
+
+
+def get_file_stat(path):
+    '''mtime and size of path, to tell when it has changed'''
+    stat = os.stat(path)
+    return (stat.st_mtime, stat.st_size)
+
+
+def find_next_bite(plan, tracker):
+    '''
+    return the index of the first bite in plan that hasn't been eaten yet, and
+    the journal's checkpoint of the bite before it, or None if the journal
+    stopped at the end of a portion
+    '''
+    # jump straight to the first portion that hasn't been eaten yet
+    start = plan.find_next(tracker.get_last_position())
+
+    # and past any bites of it that were eaten before a crash, as long as
+    # the journal agrees with the plan about where they left the roll
+    checkpoint = tracker.get_last_bite()
+    if checkpoint and start <= checkpoint.bite < len(plan) and plan[checkpoint.bite].steps_completed == checkpoint.steps_completed:
+        return checkpoint.bite + 1, checkpoint
+
+    return start, None
+
+
+def find_start(plan, tracker, kitchen):
+    '''
+    return the index of the first bite in plan that hasn't been eaten yet, and
+    put kitchen back where the last bite eaten left the roll
+    '''
+    start, checkpoint = find_next_bite(plan, tracker)
+    logger.info('already ate up to {}, starting at bite {} of {}'.format(tracker.get_last_position(), start, len(plan)))
+
+    if checkpoint:
+        kitchen.restore(checkpoint.steps_completed, checkpoint.total_inches_moved)
+        logger.info('resuming mid-portion after bite {} at {} steps completed'.format(checkpoint.bite, checkpoint.steps_completed))
+    elif start > 0:
+        # the roll is wherever the last bite eaten left it
+        kitchen.update_position(plan[start - 1].steps_completed)
+        logger.info('resuming at {} steps completed'.format(kitchen.steps_completed))
+
+    return start
+
+
+def get_started_meals(plan, tracker):
+    '''
+    the bites of every meal in plan that tracker says has been started. a plan
+    recompiled for new data keeps them as they are, so the roll is never
+    rewound from where the journal left it, see plan.load_plan()
+    '''
+    from schedule import schedule_from_plan
 
+    start, checkpoint = find_next_bite(plan, tracker)
+    schedule = schedule_from_plan(plan)
+    if start == 0:
+        return schedule[:0]
 
-def break_into_bites(portion, max_inches_per_bite=4):
-    '''break portion into 4 inch bites for the idler arm, and append the remainder'''
-    numbites = int(portion / max_inches_per_bite)  # int() always rounds down
-    last_bite = portion % max_inches_per_bite
+    return schedule[schedule['meal'] <= schedule['meal'][start - 1]]
 
-    bites = [4 for i in range(numbites)]
-    bites.append(last_bite)
 
-    return bites
+def absorb_new_data(plan, data, data_path, reload_plan, from_meal):
+    '''
+    pick up the datapoints appended to data_path since data was loaded, log
+    which meals from from_meal on will be eaten differently, and return the
+    updated data and the plan recompiled from it. the meals before from_meal
+    have been eaten, so reload_plan keeps them as they are and only the rest
+    is rescheduled, see get_started_meals(). data is loaded in full the first
+    time, after that only the new rows are read, see Data.refresh()
+    '''
+    from data import Data
+    from schedule import meal_delta
+
+    with phases.phase('data load'):
+        if data is None:
+            data = Data(data_path=data_path)
+        else:
+            data.refresh()
+    logger.info('{} has {} datapoints now, recompiling the plan'.format(data_path, len(data.y)))
+
+    old_sizes = plan.portion_sizes()
+    plan.close()
+    plan = reload_plan(data)
+
+    deltas = meal_delta(old_sizes, plan.portion_sizes(), from_meal)
+    logger.info('{} meals from meal {} on changed'.format(len(deltas), from_meal))
+    for delta in deltas:
+        logger.info('meal {} portions go from {} to {} inches'.format(delta.meal, delta.old_inches, delta.new_inches))
+
+    return data, plan
+
+
+def simulate_plan(plan, path):
+    '''
+    the whole plan at once, as fast as the machine allows: no motors, no sleeps
+    and nothing journaled. every bite is written to path in one go, as .npz or
+    csv, see schedule.save_schedule()
+    '''
+    from schedule import schedule_from_plan, save_schedule
+
+    started = time.time()
+    schedule = schedule_from_plan(plan)
+    save_schedule(path, schedule)
+    logger.info('simulated {} portions in {} bites to {} in {:.3f}s'.format(
+        int((schedule['bite'] == 0).sum()), len(schedule), path, time.time() - started))
+
+
+def nap(seconds=0.1):
+    '''sleep in between polls of a motor, timed as its own phase, see profiling.py'''
+    with phases.phase('poll sleep'):
+        time.sleep(seconds)
 
 
 def sleep_tight(waiter):
@@ -130,114 +366,314 @@ def sleep_tight(waiter):
     waiter.wait_til(tomorrow)
 
 
-if __name__ == '__main__':
-    # add some command line
-    parser = argparse.ArgumentParser(prog='testhelp.py')
-    parser.add_argument('--config', default="config.yml", help='Configuration file in YAML')
-    parser.add_argument('--sim', dest='sim', action='store_const', const=1, default=0, help='run the system in a simulation')
-    args = parser.parse_args()
+def get_installations(config):
+    '''
+    the config of each installation to run. a config with an installations list
+    runs every installation in it, each using the rest of the config as defaults,
+    otherwise the config is for the one installation. each installation is named
+    after its art unless it has a name of its own
+    '''
+    if 'installations' not in config:
+        installations = [dict(config)]
+    else:
+        defaults = dict((key, value) for key, value in config.items() if key != 'installations')
+        installations = []
+        for installation in config['installations']:
+            merged = dict(defaults)
+            merged.update(installation)
+            installations.append(merged)
 
-    sim = args.sim
-    print("Using config: {}".format(args.config))
+    for installation in installations:
+        installation.setdefault('name', installation['art'])
+
+    names = [installation['name'] for installation in installations]
+    if len(set(names)) != len(names):
+        raise ValueError('installations need different names, got {}'.format(', '.join(names)))
+
+    return installations
+
+
+def get_plan_path(name):
+    return os.path.join(get_basepath(), 'plan-{}.bin'.format(name))
 
-    # Load the yaml file
-    with open(args.config, "r") as config_file:
-        config = yaml.safe_load(config_file)
+
+def get_tracker_path(name):
+    return 'move-{}.db'.format(name)
+
+
+def run_installation(config, args, tracker_path='move.db', sim_to=None, startup=None):
+    '''
+    eat the whole schedule of one installation, config being its part of the
+    config file, see get_installations(). args are the command line arguments.
+    startup is the StartupTimer to mark each phase of starting up on, if any
+    '''
+    sim = 1 if sim_to else args.sim
 
     # get the art name from yaml
+    name = config["name"]
     file = config["art"]
     feed_ip = config["feed_ip"]
     eat_ip = config["eat_ip"]
     feed_dir = int(config["feed_dir"])
+    # seconds without hearing from a controller before checking it's still up
+    liveness_ttl = float(config.get("liveness_ttl", 5.0))
+    # speak HTTP/1.0 to the controllers, for firmware that mishandles keep-alive
+    http10 = bool(config.get("http10", False))
+    # bites per journal commit, 1 is safest, see sqltrack.Tracker
+    journal_commit_every = int(config.get("journal_commit_every", 1))
+    # 'linear' or 'poly' to size every portion from the curve instead of by meal, see Data.resample()
+    resample = config.get("resample")
 
     # put in all of the moves into a database
-    sqltrack.create_database()
+    tracker = sqltrack.Tracker(path=tracker_path, commit_every=journal_commit_every)
+    if startup:
+        startup.mark('database')
 
-    logger = configure_logger(get_basepath(), get_hostname())
     # need to set IP by art piece -gary
-    motors = initialize_motors(feed_ip=feed_ip, eat_ip=eat_ip, sim=sim)
-    if sim == 0:
-        waiter = Wait()
-
-    if file in Data.paths.keys():
-        ingredients = Data(data_path=Data.paths[file])
+    drivers = None
+    if sim == 0 and args.concurrent:
+        drivers = initialize_drivers(feed_ip, eat_ip, liveness_ttl=liveness_ttl, http10=http10, art=name)
+        motors = Motors(feed=drivers.feed.control, eat=drivers.eat.control)
     else:
+        motors = initialize_motors(feed_ip=feed_ip, eat_ip=eat_ip, sim=sim, liveness_ttl=liveness_ttl, http10=http10, art=name)
+    # each controller has its own worker thread, stopped however the run ends
+    controls = list(drivers) if drivers else list(motors) if sim == 0 else []
+    try:
+        if sim == 0:
+            waiter = Wait()
+            # learns how long moves really take, see motion.MotionTimer
+            timer = MotionTimer(auto_calibrate=True)
+        else:
+            timer = None
+        if args.profile and sim == 0:
+            # time every motor command and every sleep
+            if drivers:
+                for motor, driver in zip(Motors._fields, drivers):
+                    driver.control = phases.wrap(driver.control, '{} {} motor'.format(name, motor))
+                motors = Motors(feed=drivers.feed.control, eat=drivers.eat.control)
+            else:
+                motors = Motors(*[phases.wrap(control, '{} {} motor'.format(name, motor)) for motor, control in zip(Motors._fields, motors)])
+            waiter = phases.wrap(waiter, '{} sleep'.format(name))
+            timer = phases.wrap(timer, '{} motion timer'.format(name))
+        if startup:
+            startup.mark('motors')
+
         # Data() uses sea level data by default
-        ingredients = Data()
+        data_path = datasets.paths.get(file, datasets.paths['sea'])
+        with phases.phase('compute setup'):
+            kitchen = Compute(target_diameter=Compute.diameter_after_half_paper_moved)
+
+        # distribute total_inches_to_move into meals based on how many datapoints we have,
+        # and the percentage of their integrals to the total integral of the function.
+        # each meal is split into portions, and each portion into bites. steps, speeds
+        # and radii for every bite are compiled once into a plan file, see plan.py and
+        # schedule.compile_schedule(). it is recompiled when the config or data change.
+        # whatever has been eaten stays as it was, see get_started_meals()
+        reload_plan = lambda data: load_plan(get_plan_path(name), file, data_path, data=data, resample=resample, keep=lambda old: get_started_meals(old, tracker))
+        with phases.phase('plan load'):
+            plan = reload_plan(None)
+        num_meals = plan[-1].meal + 1
+        # kitchen follows the roll from where find_start() put it back, bite by bite
+        steps_moved = 0
+        bite_timer = bite_seconds(name)
+
+        if sim_to:
+            # skips the motion loop, and leaves the journal alone
+            simulate_plan(plan, sim_to)
+            start = len(plan)
+            steps_moved = plan[-1].steps_completed
+            kitchen.restore(plan[-1].steps_completed, plan[-1].inches_moved)
+        else:
+            start = find_start(plan, tracker, kitchen)
+
+        # datapoints get appended to the dataset while we run, see absorb_new_data()
+        data = None
+        data_stat = get_file_stat(data_path)
+        if startup:
+            startup.mark('plan')
+
+        if sim == 1 and not sim_to:
+            outname = "move-{}.txt".format(name)
+            movetest = open(outname, "w")
+            outname = "radius-{}.txt".format(name)
+            rtest = open(outname, "w")
+            count = 0
+
+        while start < len(plan):
+            for index, bite in enumerate(plan.iter_bites(start), start):
+                if bite.portion == 0 and bite.bite == 0:
+                    logger.info('eating meal {} of {}'.format(bite.meal, num_meals - 1))
+
+                if bite.bite == 0:
+                    logger.info('eating portion %s (%s inches) in %s bites', bite.portion, bite.portion_inches, bite.num_bites)
+                    if sim == 1:
+                        count += 1
+                        movetest.write("{} {} {}\n".format(count, bite.portion_inches, bite.num_bites))
+
+                logger.info('eating bite %s of %s from portion %s of meal %s', bite.bite, bite.num_bites - 1, bite.portion, bite.meal)
+
+                if startup:
+                    startup.mark('first move')
+                    logger.info('first move {:.3f}s after start'.format(startup.elapsed()))
+                    if args.startup_times:
+                        print('\n'.join(startup.get_report()))
+                    startup = None
+
+                if kitchen.steps_completed != bite.steps_completed - bite.steps:
+                    logger.warning('roll is at {} steps completed, bite {} was compiled to start at {}'.format(
+                        kitchen.steps_completed, index, bite.steps_completed - bite.steps))
+
+                # steps and velocity for the feed motor were compiled from the roll's
+                # current radius. speed for the eat motor was compiled from the outer
+                # radius of the eat roll based on total paper moved. then move.
+                bite_started = time.time()
+                if drivers:
+                    feed_and_eat(drivers, bite.steps, bite.feed_speed, bite.eat_speed, dir=feed_dir, timer=timer, art=name)
+                else:
+                    feed_paper(motors.feed, steps=bite.steps, speed=bite.feed_speed, sim=sim, dir=feed_dir, timer=timer, art=name)
+                    eat_paper(motors.eat, speed=bite.eat_speed, sim=sim, timer=timer, art=name)
+                bite_timer.observe(time.time() - bite_started)
+                steps_moved += bite.steps
+                kitchen.restore(bite.steps_completed, bite.inches_moved)
+                tracker.add_bite(datetime.today(), sqltrack.Checkpoint(index, bite.steps, bite.steps_completed, bite.inches_moved))
 
-    kitchen = Compute(target_diameter=Compute.diameter_after_half_paper_moved)
+                if sim == 1:
+                    rtest.write("{} {} {} {} {}\n".format(count, bite.feed_radius, bite.feed_speed, bite.eat_radius, bite.eat_speed))
+
+                if bite.bite == bite.num_bites - 1:
+                    # track on the portion level when a move is completed
+                    tracker.add_move(datetime.today(), bite.position)
+
+                    logger.info('finished portion %s, getting sleepy...', bite.portion)
+                    if sim == 0:
+                        sleep_tight(waiter)
+
+                    # resampled meals don't all have the same # of portions
+                    if index == len(plan) - 1 or plan[index + 1].meal != bite.meal:
+                        logger.info('finished meal {}, yum!!'.format(bite.meal))
+
+                        # new datapoints are only picked up in between meals
+                        if get_file_stat(data_path) != data_stat:
+                            data_stat = get_file_stat(data_path)
+                            data, plan = absorb_new_data(plan, data, data_path, reload_plan, bite.meal + 1)
+                            num_meals = plan[-1].meal + 1
+                            start = find_start(plan, tracker, kitchen)
+                            break
+            else:
+                break
 
-    # distribute total_inches_to_move into meals based on how many datapoints we have,
-    # and the percentage of their integrals to the total integral of the function.
-    # determine how many portions are in a meal based on the total # of movements
-    # divided by the # of meals.
-    meals = [ingredients.percents[i] * kitchen.total_inches_to_move for i in range(len(ingredients.percents))]
-    portions_per_meal = kitchen.total_num_movements / len(meals)
-    steps_completed = 0
-    move_sum = 0.0
+        if sim == 0:
+            for motor_name, motor in zip(motors._fields, motors):
+                stats = motor.comms.transport.stats
+                logger.info('{} motor made {} requests over {} connections, reuse ratio {:.3f}, {} writes saved, down {} times'.format(
+                    motor_name, stats['requests'], stats['connections'], motor.comms.transport.get_reuse_ratio(), motor.writes_saved, motor.down_count))
 
-    if sim == 1:
-        outname = "move-{}.txt".format(file)
-        movetest = open(outname, "w")
-        outname = "radius-{}.txt".format(file)
-        rtest = open(outname, "w")
-        count = 0
-
-    for i in range(len(meals)):
-        meal = meals[i]
-        logger.info('eating meal {} of {}'.format(i, len(meals) - 1))
-        logger.info('breaking meal {} into {} daily portions'.format(i, portions_per_meal))
-        portions = [meal / portions_per_meal for j in range(portions_per_meal)]
-
-        for k in range(len(portions)):
-            # break portions into 4 inch bites for the idler arm
-            logger.info('breaking portion {} ({} inches) into bites'.format(k, portions[k]))
-            bites = break_into_bites(portions[k])
-            logger.info('eating portion {} of {}'.format(k, len(portions) - 1))
-
-            # total all of the moves so far
-            move_sum += portions[k]
-
-            # check to see if that move was already made
-            last_position = sqltrack.get_last_position()
-            if(move_sum <= last_position):
-                logger.warning('already ate portion at {} < {}'.format(move_sum, last_position))
-                continue
-
-            if sim == 1:
-                count += 1
-                movetest.write("{} {} {}\n".format(count, portions[k], len(bites)))
-
-            for m in range(len(bites)):
-                bite = bites[m]
-                logger.info('eating bite {} of {} from portion {} of meal {}'.format(m, len(bites) - 1, k, i))
-
-                # calculate steps per inches for the bite, and velocity for the motor.
-                # then move.
-                steps = int(kitchen.calculate_steps_per_inches(inches_to_move=bite))
-                feed_outer_radius = kitchen.get_current_radius()
-                feed_speed = kitchen.calculate_current_velocity(kitchen.current_circumference)
-                feed_paper(motors.feed, steps=steps, speed=feed_speed, sim=sim, dir=feed_dir)
-                steps_completed += steps
-
-                # calculate outer radius for eat motor based on total paper moved, then
-                # circumference of the eat roll, which we need to calculate motor speed.
-                # then move.
-                eat_outer_radius = kitchen.calculate_outer_radius(kitchen.total_inches_moved)
-                eat_circumference = kitchen.calculate_circumference(eat_outer_radius)
-                eat_speed = kitchen.calculate_current_velocity(eat_circumference)
-                eat_paper(motors.eat, speed=eat_speed, sim=sim)
-                if sim == 1:
-                    rtest.write("{} {} {} {} {}\n".format(count, feed_outer_radius, feed_speed, eat_outer_radius, eat_speed))
+        if timer:
+            logger.info('moves took {:.3f} times as long as modelled'.format(timer.calibration()))
+
+        if sim == 1 and not sim_to:
+            movetest.close()
+            rtest.close()
+
+        kitchen.log_test_results()
+        plan.close()
+        tracker.close()
+        logger.info('actual steps completed: {}, {} of them this run'.format(kitchen.steps_completed, steps_moved))
+    finally:
+        for control in controls:
+            control.close()
 
-            # track on the portion level when a move is completed
-            sqltrack.add_move(datetime.today(), move_sum)
 
-            logger.info('finished portion {}, getting sleepy...'.format(i))
-            if sim == 0:
-                sleep_tight(waiter)
+def run_fleet(installations, args):
+    '''
+    run_installation() for every installation at once, each on its own thread
+    named after it, with its own journal, move-name.db. plans are compiled one
+    after another first, so the threads only ever open them. exits with status
+    1 as soon as any installation stops with an error, so whatever runs main.py
+    can restart the fleet.
+    '''
+    for installation in installations:
+        data_path = datasets.paths.get(installation['art'], datasets.paths['sea'])
+        tracker = sqltrack.Tracker(path=get_tracker_path(installation['name']))
+        load_plan(get_plan_path(installation['name']), installation['art'], data_path, resample=installation.get('resample'),
+                  keep=lambda old: get_started_meals(old, tracker)).close()
+        tracker.close()
+
+    def run(installation):
+        name = installation['name']
+        sim_to = None
+        if args.sim_to:
+            root, ext = os.path.splitext(args.sim_to)
+            sim_to = '{}-{}{}'.format(root, name, ext)
+        try:
+            run_installation(installation, args, tracker_path=get_tracker_path(name), sim_to=sim_to)
+        except Exception:
+            logger.exception('installation {} stopped'.format(name))
+            failed.append(name)
+
+    failed = []
+    threads = [threading.Thread(target=run, args=(installation,), name=installation['name']) for installation in installations]
+    for thread in threads:
+        # so ctrl-c stops the whole fleet
+        thread.daemon = True
+        thread.start()
+    logger.info('running {}'.format(', '.join(thread.name for thread in threads)))
+
+    # join() with no timeout can't be interrupted in python 2, and any of them
+    # can be the one that stops
+    while not failed and any(thread.is_alive() for thread in threads):
+        time.sleep(1.0)
+    if failed:
+        # the other installations' threads are daemons, they stop with us
+        logger.error('stopping the fleet, {} stopped with an error'.format(', '.join(failed)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    # add some command line
+    parser = argparse.ArgumentParser(prog='testhelp.py')
+    parser.add_argument('--config', default="config.yml", help='Configuration file in YAML')
+    parser.add_argument('--sim', dest='sim', action='store_const', const=1, default=0, help='run the system in a simulation')
+    parser.add_argument('--sim-to', metavar='PATH', help='simulate the whole schedule at once and write every bite to PATH (.npz or .csv)')
+    parser.add_argument('--concurrent', action='store_true', help='run the feed and eat motors at the same time')
+    parser.add_argument('--startup-times', action='store_true', help='print how long each phase of starting up took')
+    parser.add_argument('--profile', action='store_true', help='run under cProfile and time each phase, see profiling.py')
+    args = parser.parse_args()
 
-        logger.info('finished meal {}, yum!!'.format(i))
+    print("Using config: {}".format(args.config))
 
-    kitchen.log_test_results()
-    logger.info('actual steps completed: {}'.format(steps_completed))
+    # Load the yaml file
+    with open(args.config, "r") as config_file:
+        config = yaml.load(config_file, Loader=YAMLLoader)
+
+    # one installation, or a fleet of them, see get_installations()
+    installations = get_installations(config)
+    fleet = 'installations' in config
+    if args.profile and fleet:
+        # cProfile only sees the thread that started it, not the installations' threads
+        parser.error('--profile runs one installation at a time, give it a config without installations')
+    # where to export counters and latency histograms, see metrics.py
+    metrics_file = config.get("metrics_file")
+    metrics_port = config.get("metrics_port")
+
+    startup_timer.mark('config')
+
+    logger = configure_logger(get_basepath(), get_hostname(), fleet=fleet)
+    if args.profile:
+        from profiling import Profiler, get_profile_paths
+        # written at exit, so a run stopped with ctrl-c is profiled too
+        profiler = Profiler(*get_profile_paths(get_basepath(), installations[0]['name'], get_hostname())).start()
+        atexit.register(lambda: logger.info('profile written to {} and {}'.format(*profiler.stop())))
+    # the exporters, and the http server, are only imported when they're used
+    if metrics_file:
+        from metricsexport import FileExporter
+        atexit.register(FileExporter(metrics_file).start().stop)
+    if metrics_port:
+        from metricsexport import MetricsServer
+        atexit.register(MetricsServer(('127.0.0.1', int(metrics_port))).start().stop)
+    startup_timer.mark('logging')
+
+    if fleet:
+        run_fleet(installations, args)
+    else:
+        run_installation(installations[0], args, sim_to=args.sim_to, startup=startup_timer)
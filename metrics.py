@@ -0,0 +1,147 @@
+#!/usr/bin/python
+# counters and latency histograms, exported in the prometheus text format
+# 10/18/26
+
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+
+# seconds, from one register access on an open connection up to a long limit switch search
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Counter:
+    '''a count that only goes up'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def get_samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+
+class Histogram:
+    '''
+    how many observations fell at or below each bucket bound, plus their count
+    and sum. observations are usually seconds, see timer().
+    '''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.lock = threading.Lock()
+        self.buckets = tuple(sorted(buckets))
+        # one more for everything past the last bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def timer(self):
+        '''observe how long the with block took, even if it raised'''
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - started)
+
+    def get_samples(self, name, labels):
+        with self.lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+
+        samples = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            cumulative += n
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            samples.append(('{}_bucket'.format(name), labels + (('le', le),), cumulative))
+        samples.append(('{}_sum'.format(name), labels, total))
+        samples.append(('{}_count'.format(name), labels, count))
+
+        return samples
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+
+    escape = lambda value: str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{' + ','.join('{}="{}"'.format(key, escape(value)) for key, value in labels) + '}'
+
+
+class Registry:
+    '''
+    every metric, by name and labels. asking for a metric that doesn't exist yet
+    creates it, so code can just say
+    registry.counter('stepper_retries_total', 'requests retried', host=host).inc()
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> [kind, doc, {labels: metric}], in the order they were created
+        self.families = {}
+        self.order = []
+
+    def _get(self, kind, name, doc, make, labels):
+        labels = tuple(sorted(labels.items()))
+        with self.lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = [kind, doc, {}]
+                self.order.append(name)
+            elif family[0] != kind:
+                raise ValueError('{} is already a {}'.format(name, family[0]))
+
+            metric = family[2].get(labels)
+            if metric is None:
+                metric = family[2][labels] = make()
+
+        return metric
+
+    def counter(self, name, doc, **labels):
+        return self._get('counter', name, doc, Counter, labels)
+
+    def histogram(self, name, doc, buckets=DEFAULT_BUCKETS, **labels):
+        return self._get('histogram', name, doc, lambda: Histogram(buckets), labels)
+
+    def render(self):
+        '''every metric in the prometheus text exposition format'''
+        lines = []
+        with self.lock:
+            families = [(name,) + tuple(self.families[name][:2]) + (sorted(self.families[name][2].items()),) for name in self.order]
+
+        for name, kind, doc, metrics in families:
+            lines.append('# HELP {} {}'.format(name, doc))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for labels, metric in metrics:
+                for sample, sample_labels, value in metric.get_samples(name, labels):
+                    lines.append('{}{} {}'.format(sample, format_labels(sample_labels), repr(value)))
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        '''write render() to path through a temp file, so readers never see half of it'''
+        temp_path = '{}.tmp'.format(path)
+        with open(temp_path, 'w') as f:
+            f.write(self.render())
+        os.rename(temp_path, path)
+
+
+# the metrics everything reports to, see metricsexport.py to get them out
+registry = Registry()
+counter = registry.counter
+histogram = registry.histogram
+
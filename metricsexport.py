@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# write the metrics registry to a file, or serve it over http, for prometheus
+# 10/18/26
+
+import logging
+import threading
+import BaseHTTPServer
+from metrics import registry
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+class FileExporter:
+    '''
+    writes the registry to path every interval seconds on a background thread,
+    e.g. for node_exporter's textfile collector, which wants a name ending in .prom
+    '''
+
+    def __init__(self, path, interval=10.0, registry=registry):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self.logger = logging.getLogger('metrics')
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def export(self):
+        try:
+            self.registry.write(self.path)
+        except (IOError, OSError) as e:
+            self.logger.warning('could not write metrics to {}: {}'.format(self.path, e))
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='metrics-file')
+        self.thread.daemon = True
+        self.thread.start()
+        self.logger.info('writing metrics to {} every {}s'.format(self.path, self.interval))
+
+        return self
+
+    def stop(self):
+        '''stop the thread, and write the metrics one last time'''
+        self.stopped.set()
+        self.thread.join()
+        self.export()
+
+
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''answers GET /metrics with the registry'''
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = self.server.registry.render()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.logger.debug('%s - %s', self.address_string(), format % args)
+
+
+class MetricsServer(BaseHTTPServer.HTTPServer):
+    '''
+    serves the registry on address, a (host, port) tuple, from a background
+    thread. keep host at 127.0.0.1 unless the network should see it too.
+    '''
+
+    allow_reuse_address = True
+
+    def __init__(self, address, registry=registry):
+        BaseHTTPServer.HTTPServer.__init__(self, address, MetricsHandler)
+        self.registry = registry
+        self.logger = logging.getLogger('metrics')
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='metrics-http')
+        self.thread.daemon = True
+        self.thread.start()
+        self.logger.info('serving metrics at http://{}:{}/metrics'.format(*self.server_address))
+
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# predict how long a motor move takes and wait for it without polling the whole time
+# 10/18/26
+
+import time
+import logging
+from collections import deque
+
+
+class MotionTimer:
+    '''
+    the controller moves at ProfileVelocity revolutions per minute, so a move of
+    some # of steps takes steps / steps_per_revolution / (speed / 60) seconds,
+    plus a little for ramping up and down (overhead). wait_until() sleeps through
+    most of that, then polls tight and backs off until the move is done.
+
+    every move's modelled and actual time is kept so the model can be checked
+    against the real motors, see calibration(). set auto_calibrate to have
+    predictions scaled by it as moves finish.
+    '''
+
+    def __init__(self, steps_per_revolution=25000, overhead=0.25, lead=0.9,
+                 min_poll=0.02, max_poll=0.5, history=200, auto_calibrate=False):
+        self.logger = self._init_logger()
+        self.steps_per_revolution = steps_per_revolution
+        self.overhead = overhead
+        self.lead = lead  # fraction of the predicted time to sleep before polling
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self.auto_calibrate = auto_calibrate
+        self.scale = 1.0
+        self.history = deque(maxlen=history)
+
+    def _init_logger(self):
+        logger = logging.getLogger('motion')
+        logger.info('motion logger instantiated')
+
+        return logger
+
+    def model(self, steps, speed):
+        '''seconds a move of steps at speed should take, before calibration'''
+        # speed is sent to the controller as an unsigned int, see StepperControl.move_relative
+        rpm = max(int(speed), 1)
+        revolutions = abs(steps) / float(self.steps_per_revolution)
+
+        return self.overhead + revolutions / rpm * 60
+
+    def predict(self, steps, speed):
+        '''seconds a move of steps at speed should take'''
+        return self.model(steps, speed) * self.scale
+
+    def wait_until(self, check, steps, speed, started=None):
+        '''
+        wait until check() is true for a move of steps at speed that started at
+        time started (defaults to now). returns (predicted, actual) seconds.
+        '''
+        started = time.time() if started is None else started
+        predicted = self.predict(steps, speed)
+        time.sleep(max(0, started + predicted * self.lead - time.time()))
+
+        delay = self.min_poll
+        while not check():
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_poll)
+
+        actual = time.time() - started
+        self.record(self.model(steps, speed), predicted, actual)
+
+        return predicted, actual
+
+    def record(self, modelled, predicted, actual):
+        self.history.append((modelled, actual))
+        self.logger.info('move took {:.3f}s, predicted {:.3f}s'.format(actual, predicted))
+
+        if self.auto_calibrate:
+            self.scale = self.calibration()
+
+    def calibration(self):
+        '''median of actual / modelled time over the recorded moves, 1.0 if there are none'''
+        ratios = sorted(actual / modelled for modelled, actual in self.history if modelled > 0)
+        if not ratios:
+            return 1.0
+
+        return ratios[len(ratios) // 2]
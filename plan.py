@@ -0,0 +1,222 @@
+#!/usr/bin/python
+# fixed width binary plan file holding the compiled schedule, memory-mapped at startup
+# 10/18/26
+
+import os
+import mmap
+import struct
+import hashlib
+import logging
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from compute import Compute
+from profiling import phases
+
+
+logger = logging.getLogger('plan')
+
+# one record per bite, see schedule.schedule_dtype, which is built from these.
+# steps_completed, inches_moved and the radii are the state of the roll after
+# the bite has been eaten. byte order is fixed so a schedule can be written
+# to disk as is. reading a plan only needs the standard library, numpy is
+# only imported when a plan has to be compiled
+bite_fields = [
+    ('meal', '<i4'),
+    ('portion', '<i4'),
+    ('bite', '<i4'),
+    ('num_bites', '<i4'),
+    ('portion_inches', '<f8'),
+    ('position', '<f8'),
+    ('inches', '<f8'),
+    ('steps', '<i4'),
+    ('steps_completed', '<i8'),
+    ('inches_moved', '<f8'),
+    ('feed_radius', '<f8'),
+    ('feed_speed', '<f8'),
+    ('eat_radius', '<f8'),
+    ('eat_speed', '<f8'),
+]
+bite_names = [name for name, format in bite_fields]
+
+Bite = namedtuple('Bite', bite_names)
+
+# header: magic, version, art name, sha1 of config + dataset, Compute constants
+# (see compute_constants()), # of records. records follow, one per bite.
+# version 2 widened the art name from 16 bytes
+magic = b'SCRLPLAN'
+version = 2
+max_art_length = 64
+header = struct.Struct('<8sH{}s40s10dq'.format(max_art_length))
+record = struct.Struct('<iiiidddiqddddd')
+
+
+def compute_constants(target_diameter):
+    '''the Compute constants a plan was compiled with, as a tuple of floats'''
+    return tuple(float(c) for c in (
+        Compute.paper_thickness,
+        Compute.roll_width,
+        Compute.core_diameter,
+        Compute.initial_diameter,
+        target_diameter,
+        Compute.steps_per_revolution,
+        Compute.total_num_movements,
+        Compute.max_inches_per_move,
+        Compute.max_velocity,
+        Compute.target_velocity,
+    ))
+
+
+def hash_inputs(data_path, **settings):
+    '''
+    sha1 of the dataset at data_path and the config settings the schedule is
+    compiled with. only those settings, so editing anything else in the config,
+    i.e. an ip address, doesn't recompile the plan
+    '''
+    sha = hashlib.sha1()
+    with open(data_path, 'rb') as f:
+        sha.update(f.read())
+    sha.update(repr(sorted(settings.items())).encode('ascii'))
+
+    return sha.hexdigest()
+
+
+def write_plan(path, art, digest, constants, schedule):
+    '''
+    write schedule, an array of schedule.schedule_dtype, to path. it goes
+    through a temp file so a crash never leaves half a plan
+    '''
+    # struct would cut a longer name short, and the plan would never be valid
+    encoded_art = art.encode('ascii')
+    if len(encoded_art) > max_art_length:
+        raise ValueError('art name {} is longer than {} bytes'.format(art, max_art_length))
+
+    logger.info('writing {} bites to plan file {}'.format(len(schedule), path))
+    temp_path = '{}.tmp'.format(path)
+
+    with open(temp_path, 'wb') as f:
+        f.write(header.pack(magic, version, encoded_art, digest.encode('ascii'), *(constants + (len(schedule),))))
+        f.write(schedule.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.rename(temp_path, path)
+
+
+class Plan:
+    '''
+    read-only view of a plan file. the file is memory-mapped, so opening it and
+    jumping to any bite costs the same no matter how long the schedule is.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        fields = header.unpack_from(self.map, 0)
+        self.magic, self.version = fields[0], fields[1]
+        self.art = fields[2].rstrip(b'\0').decode('ascii')
+        self.digest = fields[3].decode('ascii')
+        self.constants = fields[4:14]
+        self.num_bites = fields[14]
+
+    def __len__(self):
+        return self.num_bites
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.num_bites
+        if not 0 <= index < self.num_bites:
+            raise IndexError('plan index out of range')
+
+        return Bite(*record.unpack_from(self.map, header.size + index * record.size))
+
+    def is_valid(self, art, digest, constants):
+        '''check that the plan was compiled from the same config, dataset and Compute constants'''
+        return (self.magic == magic and self.version == version and self.art == art and
+                self.digest == digest and self.constants == constants and
+                len(self.map) == header.size + self.num_bites * record.size)
+
+    def positions(self):
+        '''lazy sequence of the position column, for bisecting'''
+        return _Column(self, bite_names.index('position'))
+
+    def find_next(self, last_position):
+        '''return the index of the first bite of the first portion past last_position'''
+        return bisect_right(self.positions(), last_position)
+
+    def portion_sizes(self):
+        '''inches in each portion of each meal, from the first bite of each meal'''
+        meals = _Column(self, bite_names.index('meal'))
+        num_meals = self[-1].meal + 1 if self.num_bites else 0
+
+        return [self[bisect_left(meals, meal)].portion_inches for meal in range(num_meals)]
+
+    def iter_bites(self, start=0):
+        '''yield each bite from start to the end of the plan'''
+        for index in range(start, self.num_bites):
+            yield self[index]
+
+    def close(self):
+        self.map.close()
+
+
+class _Column:
+    '''indexable view of one field of a plan's records, so bisect only unpacks what it looks at'''
+
+    def __init__(self, plan, field):
+        self.plan = plan
+        self.field = field
+
+    def __len__(self):
+        return len(self.plan)
+
+    def __getitem__(self, index):
+        return self.plan[index][self.field]
+
+
+def load_plan(path, art, data_path, target_diameter=Compute.diameter_after_half_paper_moved, data=None, resample=None, keep=None):
+    '''
+    open the plan file at path, compiling and writing it first if it is missing
+    or was compiled from a different dataset, resample setting or set of Compute
+    constants. pass data to compile from an already loaded Data instead of
+    reading data_path. resample is passed on to compile_schedule().
+
+    keep is called with a plan that is only out of date because the dataset or
+    resample changed, and returns the bites of it that have already been eaten,
+    which the recompiled plan keeps as they are, see compile_schedule()
+    '''
+    digest = hash_inputs(data_path, resample=resample)
+    constants = compute_constants(target_diameter)
+    eaten = None
+
+    try:
+        plan = Plan(path)
+    except (IOError, ValueError, struct.error):
+        logger.info('no readable plan file at {}'.format(path))
+    else:
+        if plan.is_valid(art, digest, constants):
+            logger.info('using plan file {} with {} bites'.format(path, len(plan)))
+            return plan
+
+        logger.info('plan file {} is out of date'.format(path))
+        # same art and Compute constants, so its bites are where the roll really went
+        if keep is not None and plan.is_valid(art, plan.digest, constants):
+            eaten = keep(plan)
+        plan.close()
+
+    # the only time numpy is needed
+    from data import Data
+    from schedule import compile_schedule
+
+    logger.info('compiling plan for {} from {}'.format(art, data_path))
+    with phases.phase('data load'):
+        data = data or Data(data_path=data_path)
+    with phases.phase('compute setup'):
+        compute = Compute(target_diameter=target_diameter)
+    with phases.phase('schedule'):
+        schedule = compile_schedule(data, compute, resample=resample, eaten=eaten)
+    with phases.phase('plan write'):
+        write_plan(path, art, digest, constants, schedule)
+
+    return Plan(path)
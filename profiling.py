@@ -0,0 +1,135 @@
+#!/usr/bin/python
+# cProfile and phase timers for a --profile run
+# 10/18/26
+
+import os
+import time
+import threading
+from socket import gethostname
+from contextlib import contextmanager
+
+
+class PhaseTimer:
+    '''
+    adds up the calls to and time spent in each named phase of a run, i.e.
+    data load, schedule, each motor command, each sleep. phases can nest, a
+    phase's time includes any phases inside it. cheap enough to leave on.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> [calls, seconds, longest]
+        self.totals = {}
+
+    def add(self, name, seconds):
+        with self.lock:
+            total = self.totals.setdefault(name, [0, 0.0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+            total[2] = max(total[2], seconds)
+
+    @contextmanager
+    def phase(self, name):
+        '''time the with block as name, even if it raised'''
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - started)
+
+    def wrap(self, target, name):
+        '''target with every method call timed as the phase "name.method", see PhaseProxy'''
+        return PhaseProxy(target, name, self)
+
+    def reset(self):
+        with self.lock:
+            self.totals = {}
+
+    def get_report(self):
+        '''one line per phase, the most time first'''
+        with self.lock:
+            totals = sorted(self.totals.items(), key=lambda item: -item[1][1])
+
+        lines = ['{:<32} {:>8} {:>10} {:>10} {:>10}'.format('phase', 'calls', 'total', 'mean', 'longest')]
+        for name, (calls, seconds, longest) in totals:
+            lines.append('{:<32} {:>8} {:>9.3f}s {:>9.6f}s {:>9.6f}s'.format(name, calls, seconds, seconds / calls, longest))
+
+        return lines
+
+
+class PhaseProxy:
+    '''
+    stands in for target, timing each method called on it as its own phase.
+    anything that isn't callable is passed straight through.
+    '''
+
+    def __init__(self, target, name, phases):
+        self._target = target
+        self._name = name
+        self._phases = phases
+
+    def __getattr__(self, attr):
+        value = getattr(self._target, attr)
+        if not callable(value):
+            return value
+
+        phase = '{}.{}'.format(self._name, attr)
+
+        def timed(*args, **kwargs):
+            with self._phases.phase(phase):
+                return value(*args, **kwargs)
+
+        return timed
+
+
+# the phases everything reports to
+phases = PhaseTimer()
+
+
+def get_profile_paths(basepath, name, hostname=None):
+    '''format output files as "hostname-name.prof" for cProfile and "hostname-name.phases.txt"'''
+    hostname = hostname or gethostname().split('.')[0]
+    prefix = os.path.join(basepath, '{}-{}'.format(hostname, name))
+
+    return '{}.prof'.format(prefix), '{}.phases.txt'.format(prefix)
+
+
+class Profiler:
+    '''
+    runs cProfile from start() to stop(), then writes its stats to profile_path,
+    for pstats or snakeviz, and the phase report followed by the functions that
+    took the most time to summary_path. only the thread that called start() is
+    profiled; phases are timed on every thread.
+    '''
+
+    def __init__(self, profile_path, summary_path, phases=phases, top=30):
+        self.profile_path = profile_path
+        self.summary_path = summary_path
+        self.phases = phases
+        self.top = top
+        self.profile = None
+
+    def start(self):
+        # only a --profile run pays for importing these
+        import cProfile
+
+        self.phases.reset()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+        return self
+
+    def stop(self):
+        '''stop profiling and write both files, returns their paths'''
+        import pstats
+
+        self.profile.disable()
+        self.profile.dump_stats(self.profile_path)
+
+        with open(self.summary_path, 'w') as summary:
+            summary.write('\n'.join(self.phases.get_report()))
+            summary.write('\n\n')
+            stats = pstats.Stats(self.profile, stream=summary)
+            stats.sort_stats('cumulative').print_stats(self.top)
+
+        return self.profile_path, self.summary_path
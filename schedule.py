@@ -0,0 +1,164 @@
+#!/usr/bin/python
+# compile the whole motion plan - every bite of every portion of every meal - into numpy arrays
+# 10/18/26
+
+import logging
+import numpy as np
+from collections import namedtuple
+from plan import Bite, bite_fields, header, record
+
+
+# one row per bite, laid out exactly like a plan file record, see plan.py
+schedule_dtype = np.dtype(bite_fields)
+assert record.size == schedule_dtype.itemsize
+
+# a meal whose portions change size when the data does, old_inches is None for a new meal
+MealDelta = namedtuple('MealDelta', ['meal', 'old_inches', 'new_inches'])
+
+logger = logging.getLogger('schedule')
+
+
+def portion_sizes(percents, total_inches_to_move, total_num_movements):
+    '''inches in each portion of each meal, and # of portions per meal, for data.percents'''
+    meals = np.asarray(percents) * total_inches_to_move
+    portions_per_meal = total_num_movements // len(meals)
+
+    return meals / portions_per_meal, portions_per_meal
+
+
+def meal_delta(old_portion_inches, new_portion_inches, from_meal=0):
+    '''
+    compare the portion sizes of every meal from from_meal on, before and after
+    the data changed, i.e. after Data.append(). returns a list of MealDelta for
+    the meals that will be eaten differently.
+    '''
+    deltas = []
+    for meal in range(from_meal, len(new_portion_inches)):
+        old = old_portion_inches[meal] if meal < len(old_portion_inches) else None
+        # recompiling the same portions can come out a few ulps off
+        if old is None or not np.isclose(old, new_portion_inches[meal]):
+            deltas.append(MealDelta(meal, old, new_portion_inches[meal]))
+
+    return deltas
+
+
+def split_into_bites(portion_inches, max_inches_per_bite=4):
+    '''
+    break every portion into 4 inch bites for the idler arm, plus the remainder.
+    returns # of bites in each portion, and the inches of every bite of every
+    portion end to end
+    '''
+    full_bites = (portion_inches / max_inches_per_bite).astype(int)  # rounds down like int()
+    bites_per_portion = full_bites + 1
+    portion_starts = np.cumsum(bites_per_portion) - bites_per_portion
+    bite = np.arange(bites_per_portion.sum()) - np.repeat(portion_starts, bites_per_portion)
+
+    # full bites, then the remainder
+    last_bite = np.repeat(portion_inches % max_inches_per_bite, bites_per_portion)
+    inches = np.where(bite < np.repeat(full_bites, bites_per_portion), float(max_inches_per_bite), last_bite)
+
+    return bites_per_portion, inches
+
+
+def compile_schedule(data, compute, resample=None, eaten=None):
+    '''
+    distribute compute.total_inches_to_move into meals based on data.percents,
+    split each meal into compute.total_num_movements / # of meals identical
+    portions, and break those portions into bites. then calculate steps, speeds
+    and radii for every bite in one pass.
+
+    set resample to 'linear' or 'poly' to size every portion on its own from the
+    curve instead, see Data.resample(). each portion then belongs to the meal
+    its slice of the dataset starts in.
+
+    pass eaten, the bites of the meals already eaten from an earlier schedule, to
+    keep them exactly as they were and only schedule the meals after them: the
+    paper that is left is shared out over those meals by the new data.
+
+    compute is advanced through the whole schedule, starting from its current
+    state, or from where the last eaten bite left the roll.
+    returns a numpy record array with one row per bite, see schedule_dtype.
+    '''
+    if resample:
+        portion_inches = data.resample(compute.total_num_movements, compute.total_inches_to_move, method=resample)
+        slice_starts = np.linspace(0, len(data.y) - 1, len(portion_inches) + 1)[:-1]
+        portion_meal = np.minimum(slice_starts.astype(int), len(data.y) - 2)
+        logger.info('compiling {} resampled portions'.format(len(portion_inches)))
+    else:
+        meal_inches, portions_per_meal = portion_sizes(data.percents, compute.total_inches_to_move, compute.total_num_movements)
+        logger.info('compiling {} meals of {} portions each'.format(len(meal_inches), portions_per_meal))
+        portion_inches = np.repeat(meal_inches, portions_per_meal)
+        portion_meal = np.repeat(np.arange(len(meal_inches)), portions_per_meal)
+
+    position = 0.0
+    if eaten is not None and len(eaten):
+        # the roll is wherever the last eaten bite left it
+        compute.restore(int(eaten['steps_completed'][-1]), float(eaten['inches_moved'][-1]))
+        position = eaten['position'][-1]
+        future = portion_meal > eaten['meal'][-1]
+        if not future.any():
+            return eaten.copy()
+        portion_inches, portion_meal = portion_inches[future], portion_meal[future]
+        portion_inches = portion_inches * ((compute.total_inches_to_move - position) / portion_inches.sum())
+        logger.info('keeping {} bites already eaten, rescheduling {} portions'.format(len(eaten), len(portion_inches)))
+
+    bites_per_portion, inches = split_into_bites(portion_inches)
+    portion_starts = np.cumsum(bites_per_portion) - bites_per_portion
+    # index of each portion within its meal
+    portion = np.arange(len(portion_inches)) - np.searchsorted(portion_meal, portion_meal)
+
+    schedule = np.zeros(bites_per_portion.sum(), dtype=schedule_dtype)
+    schedule['meal'] = np.repeat(portion_meal, bites_per_portion)
+    schedule['portion'] = np.repeat(portion, bites_per_portion)
+    schedule['bite'] = np.arange(len(schedule)) - np.repeat(portion_starts, bites_per_portion)
+    schedule['num_bites'] = np.repeat(bites_per_portion, bites_per_portion)
+    schedule['portion_inches'] = np.repeat(portion_inches, bites_per_portion)
+    schedule['position'] = np.repeat(position + np.cumsum(portion_inches), bites_per_portion)
+    schedule['inches'] = inches
+
+    logger.info('calculating steps for {} bites'.format(len(schedule)))
+    steps_completed = compute.steps_completed
+    schedule['steps'] = compute.calculate_steps_per_bites(schedule['inches'])
+    schedule['steps_completed'] = steps_completed + np.cumsum(schedule['steps'])
+    schedule['inches_moved'] = compute.calculate_inches_per_steps(schedule['steps_completed'])
+
+    # same arithmetic as the get_current_* methods, for every bite at once
+    num_revs_completed = schedule['steps_completed'] / float(compute.steps_per_revolution)
+    schedule['feed_radius'] = compute.initial_radius - (num_revs_completed * compute.paper_thickness)
+    calculate_velocity = np.vectorize(compute.calculate_current_velocity, otypes=[np.float64])
+    schedule['feed_speed'] = calculate_velocity(compute.calculate_circumference(schedule['feed_radius']))
+
+    # outer radius for the eat roll is based on total paper moved
+    schedule['eat_radius'] = compute.calculate_outer_radius(schedule['inches_moved'])
+    schedule['eat_speed'] = calculate_velocity(compute.calculate_circumference(schedule['eat_radius']))
+
+    if eaten is not None:
+        schedule = np.concatenate([eaten, schedule])
+
+    return schedule
+
+
+def iter_bites(schedule):
+    '''yield each row of the schedule as a Bite namedtuple of plain python values'''
+    for row in schedule.tolist():
+        yield Bite(*row)
+
+
+def schedule_from_plan(plan):
+    '''the records of an open plan.Plan as a schedule array, read in one go'''
+    return np.frombuffer(plan.map, dtype=schedule_dtype, count=len(plan), offset=header.size).copy()
+
+
+def save_schedule(path, schedule):
+    '''
+    write every column of schedule to path in one go: a numpy .npz archive with
+    one array per column if path ends in .npz, otherwise a csv with a header.
+    floats are written with enough digits to read back exactly.
+    '''
+    names = schedule.dtype.names
+    if path.endswith('.npz'):
+        np.savez(path, **dict((name, schedule[name]) for name in names))
+        return
+
+    fmt = ['%d' if schedule.dtype[name].kind == 'i' else '%.17g' for name in names]
+    np.savetxt(path, schedule, fmt=fmt, delimiter=',', header=','.join(names), comments='')
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# simulate unwinding the roll in vectorized chunks of steps instead of one step at a time
+# 10/18/26
+
+import numpy as np
+from collections import namedtuple
+from datetime import datetime
+
+
+# columns of the sampled traces, each the state of the roll after a step
+sample_fields = ('steps_completed', 'total_inches_moved', 'num_revs_completed',
+                 'current_radius', 'current_circumference', 'inches_per_step', 'velocity')
+
+Simulation = namedtuple('Simulation', ['samples', 'min_radius', 'max_radius', 'min_velocity', 'max_velocity', 'elapsed'])
+
+
+def run_simulation(compute, num_steps=None, sample_every=0, chunk_size=1000000):
+    '''
+    step compute through num_steps steps, defaulting to total_steps_to_complete, and
+    leave it in the same state Compute.update_sim() would have. each chunk of steps
+    is one set of array operations, so memory is bounded by chunk_size.
+
+    total_inches_moved is a running sum, just like update_sim(), so the totals
+    match Compute.print_totals() after the reference Compute.run_simulation().
+
+    if sample_every is set, the state after every sample_every-th step is kept
+    and returned as a numpy array with one column per sample_fields entry.
+    '''
+    start = datetime.now()
+    if num_steps is None:
+        num_steps = int(compute.total_steps_to_complete)
+
+    first_step = compute.steps_completed
+    last_step = first_step + num_steps
+    total_inches_moved = compute.total_inches_moved
+    min_circumference = max_circumference = compute.current_circumference
+    min_radius = max_radius = compute.current_radius
+    samples = []
+
+    for chunk_start in range(first_step, last_step, chunk_size):
+        # steps completed before and after each step in the chunk
+        steps_before = np.arange(chunk_start, min(chunk_start + chunk_size, last_step))
+        steps_after = steps_before + 1
+
+        # same arithmetic as the get_* methods, in the same order
+        inches_per_step = compute.calculate_circumference(
+            compute.initial_radius - (steps_before / float(compute.steps_per_revolution)) * compute.paper_thickness
+        ) / compute.steps_per_revolution
+        num_revs_completed = steps_after / float(compute.steps_per_revolution)
+        current_radius = compute.initial_radius - (num_revs_completed * compute.paper_thickness)
+        current_circumference = compute.calculate_circumference(current_radius)
+
+        # cumsum adds one element at a time, so it rounds exactly like update_sim()
+        inches_per_step[0] += total_inches_moved
+        inches_moved = np.cumsum(inches_per_step)
+        total_inches_moved = inches_moved[-1]
+
+        min_radius = min(min_radius, current_radius.min())
+        max_radius = max(max_radius, current_radius.max())
+        min_circumference = min(min_circumference, current_circumference.min())
+        max_circumference = max(max_circumference, current_circumference.max())
+
+        if sample_every:
+            sampled = steps_after % sample_every == 0
+            circumference = current_circumference[sampled]
+            samples.append(np.column_stack([
+                steps_after[sampled],
+                inches_moved[sampled],
+                num_revs_completed[sampled],
+                current_radius[sampled],
+                circumference,
+                circumference / compute.steps_per_revolution,
+                [compute.calculate_current_velocity(c) for c in circumference],
+            ]))
+
+    compute.steps_completed = last_step
+    compute.total_inches_moved = float(total_inches_moved)
+    compute.num_revs_completed = compute.get_num_revs_completed()
+    compute.current_radius = compute.get_current_radius()
+    compute.current_circumference = compute.get_current_circumference()
+    compute.inches_per_step = compute.get_inches_per_step()
+
+    # velocity only goes down as circumference goes up, so its extremes
+    # are at the extremes of circumference
+    return Simulation(
+        samples=np.concatenate(samples) if samples else np.empty((0, len(sample_fields))),
+        min_radius=float(min_radius),
+        max_radius=float(max_radius),
+        min_velocity=compute.calculate_current_velocity(max_circumference),
+        max_velocity=compute.calculate_current_velocity(min_circumference),
+        elapsed=datetime.now() - start,
+    )
+
+
+def save_samples(path, samples):
+    '''write sampled traces to a csv file with a header row'''
+    np.savetxt(path, samples, delimiter=',', header=','.join(sample_fields), comments='')
+
+
+def print_simulation(simulation):
+    '''debug purposes only'''
+    print('min radius: {}'.format(simulation.min_radius))
+    print('max radius: {}'.format(simulation.max_radius))
+    print('min velocity: {}'.format(simulation.min_velocity))
+    print('max velocity: {}'.format(simulation.max_velocity))
+    print('samples taken: {}'.format(len(simulation.samples)))
+    print('total time elapsed: {}'.format(simulation.elapsed))
+
+
+def validate(compute_class, num_steps=100000, **kwargs):
+    '''
+    run num_steps with the per-step reference, Compute.update_sim(), and with
+    run_simulation(), and return whether both leave the roll in the same state
+    '''
+    reference = compute_class(**kwargs)
+    for i in range(num_steps):
+        reference.update_sim()
+
+    fast = compute_class(**kwargs)
+    run_simulation(fast, num_steps=num_steps)
+
+    attrs = ('steps_completed', 'total_inches_moved', 'num_revs_completed',
+             'current_radius', 'current_circumference', 'inches_per_step')
+
+    return all(getattr(reference, attr) == getattr(fast, attr) for attr in attrs)
@@ -1,41 +1,81 @@
 import sqlite3
+from collections import namedtuple
 from datetime import datetime, timedelta
 
 
-def create_database():
-    conn = sqlite3.connect("move.db")
-    c = conn.cursor()
-    try:
-        c.execute("create table move (date text, position real)")
-        conn.commit()
-        conn.close()
-        add_move(datetime.today(), 0.0)
-    except sqlite3.OperationalError:
-        print("Already exists")
+# a finished bite: its index in the plan, its steps, and where it left the roll
+Checkpoint = namedtuple('Checkpoint', ['bite', 'steps', 'steps_completed', 'total_inches_moved'])
 
 
-def add_move(date,position):
-    conn = sqlite3.connect("move.db")
-    c = conn.cursor()
-    c.execute("insert into move(date,position) values(?,?)", [date, position])
-    conn.commit()
-    conn.close()
+class Tracker:
+    '''
+    keeps track of how far the paper has moved in a sqlite database at path.
+    one connection is held open for the life of the tracker, and the last
+    position is kept in memory, so get_last_position() never touches the disk.
 
+    every finished bite is journaled too, see add_bite(). commit_every sets how
+    durable that is: 1 syncs each bite to disk before the next one moves, more
+    groups that many bites per commit, so a power loss can replay up to
+    commit_every - 1 bites. finished portions are always committed right away.
+    '''
 
-def get_last_position():
-    conn = sqlite3.connect("move.db")
-    c = conn.cursor()
-    c.execute("select max(position) from move")
-    ret = c.fetchone()
-    conn.close()
+    def __init__(self, path="move.db", commit_every=1):
+        self.path = path
+        self.commit_every = commit_every
+        self.pending = 0
+        self.conn = sqlite3.connect(path)
+        # readers never block the writer, and a commit is one append to the log
+        self.conn.execute("pragma journal_mode=wal")
+        # but still sync on every commit, the pi can lose power at any time
+        self.conn.execute("pragma synchronous=full")
+        self.create_database()
+        self.last_position = self.conn.execute("select max(position) from move").fetchone()[0]
+        row = self.conn.execute("select bite, steps, steps_completed, total_inches_moved from bite order by rowid desc limit 1").fetchone()
+        self.last_bite = Checkpoint(*row) if row else None
 
-    return ret[0]
+    def create_database(self):
+        c = self.conn.cursor()
+        try:
+            c.execute("create table move (date text, position real)")
+            c.execute("insert into move(date,position) values(?,?)", [datetime.today(), 0.0])
+            self.conn.commit()
+        except sqlite3.OperationalError:
+            print("Already exists")
 
+        # max(position) is read straight off the index instead of scanning the table
+        c.execute("create index if not exists move_position on move (position)")
+        c.execute("create table if not exists bite (date text, bite integer, steps integer, steps_completed integer, total_inches_moved real)")
+        self.conn.commit()
 
-def get_all_position():
-    conn = sqlite3.connect("move.db")
-    c = conn.cursor()
-    c.execute("select * from move order by position")
-    for row in c:
-        print(row)
-    conn.close()
+    def add_move(self, date, position):
+        self.conn.execute("insert into move(date,position) values(?,?)", [date, position])
+        self.commit()
+        self.last_position = position if self.last_position is None else max(self.last_position, position)
+
+    def add_bite(self, date, checkpoint):
+        '''journal a finished bite, committing it as often as commit_every says'''
+        self.conn.execute("insert into bite(date,bite,steps,steps_completed,total_inches_moved) values(?,?,?,?,?)", [date] + list(checkpoint))
+        self.last_bite = checkpoint
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def get_last_position(self):
+        return self.last_position
+
+    def get_last_bite(self):
+        '''Checkpoint of the last journaled bite, or None if no bite has been eaten yet'''
+        return self.last_bite
+
+    def get_all_position(self):
+        c = self.conn.execute("select * from move order by position")
+        for row in c:
+            print(row)
+
+    def close(self):
+        self.commit()
+        self.conn.close()
@@ -0,0 +1,58 @@
+#!/usr/bin/python
+# time how long each phase of starting up takes, from when the process started
+# 10/18/26
+
+import os
+import sys
+import time
+
+
+def get_process_start_time():
+    '''
+    wall clock time this process was started, from /proc on linux. falls back
+    to now elsewhere, which leaves out the interpreter's own startup
+    '''
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            # the command name can have spaces in it, fields after it are plain
+            ticks = float(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime', 'r') as f:
+            uptime = float(f.read().split()[0])
+    except (IOError, OSError, IndexError, ValueError):
+        return time.time()
+
+    # btime in /proc/stat is whole seconds, so count back from now instead
+    return time.time() - (uptime - ticks / os.sysconf('SC_CLK_TCK'))
+
+
+class StartupTimer:
+    '''
+    marks the end of each phase of startup, i.e. imports, config, motors, and
+    reports how long each took. started defaults to when the process started,
+    so the first phase includes starting python itself.
+    '''
+
+    def __init__(self, started=None):
+        self.started = get_process_start_time() if started is None else started
+        self.last = self.started
+        self.phases = []
+
+    def mark(self, phase):
+        '''end phase now, returns how long it took'''
+        now = time.time()
+        seconds = now - self.last
+        self.phases.append((phase, seconds))
+        self.last = now
+
+        return seconds
+
+    def elapsed(self):
+        return self.last - self.started
+
+    def get_report(self):
+        '''one line per phase, plus the total and whether numpy got loaded'''
+        lines = ['{:<20} {:>8.3f}s'.format(phase, seconds) for phase, seconds in self.phases]
+        lines.append('{:<20} {:>8.3f}s'.format('total', self.elapsed()))
+        lines.append('numpy imported: {}'.format('numpy' in sys.modules))
+
+        return lines
@@ -5,15 +5,122 @@
 # updated by Gary Stein August 2018
 # updated 9/3/18
 
-import urllib2
 import urllib
 import httplib
+import socket
 import struct
 import time
 import sys
+import threading
+import Queue
+import metrics
 from datetime import datetime
 
 
+class HTTP10Connection(httplib.HTTPConnection):
+    # Motor controller needs 1.0 not 1.1
+    _http_vsn = 10
+    _http_vsn_str = 'HTTP/1.0'
+
+
+class StepperTransport:
+    '''
+    keeps one persistent HTTP connection per controller host instead of opening
+    a new one for every register access. if the controller drops the connection,
+    or answers in a way that closes it, the next request reconnects transparently.
+
+    set http10 to speak HTTP/1.0 to the controller; keep-alive is then asked for
+    with a Connection header, which HTTP/1.0 servers are free to ignore.
+    '''
+
+    def __init__(self, http10=False):
+        self.http10 = http10
+        self.connections = {}
+        self.stats = {'requests': 0, 'connections': 0, 'reused': 0, 'retries': 0}
+
+    def _get_connection(self, host, timeout):
+        conn = self.connections.get(host)
+        if conn is None:
+            conn_class = HTTP10Connection if self.http10 else httplib.HTTPConnection
+            conn = self.connections[host] = conn_class(host, timeout=timeout)
+
+        # httplib reconnects on its own once the socket is closed
+        if conn.sock is None:
+            self.stats['connections'] += 1
+        else:
+            self.stats['reused'] += 1
+            conn.sock.settimeout(timeout)
+        conn.timeout = timeout
+
+        return conn
+
+    def _send(self, host, method, path, body, timeout):
+        conn = self._get_connection(host, timeout)
+        headers = {'Connection': 'keep-alive'}
+        if body is not None:
+            # same as urllib2 sends with Request.add_data()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        conn.request(method, path, body, headers)
+        response = conn.getresponse()
+        # always read the whole response, or the connection can't be reused
+        html = response.read()
+        if response.will_close:
+            conn.close()
+        if response.status >= 400:
+            raise IOError('{} {} on {}{}'.format(response.status, response.reason, host, path))
+
+        return html
+
+    def request(self, host, method, path, body=None, timeout=None):
+        '''
+        send a request to host and return the response body. a request on a reused
+        connection that fails is retried once on a fresh one, since the controller
+        may have closed it while we were idle. errors are raised as IOError.
+        '''
+        self.stats['requests'] += 1
+        metrics.counter('stepper_requests_total', 'register accesses sent to a controller', host=host, method=method).inc()
+        with metrics.histogram('stepper_request_seconds', 'time to answer a register access, retry included', host=host, method=method).timer():
+            try:
+                return self._request(host, method, path, body, timeout)
+            except IOError:
+                metrics.counter('stepper_request_errors_total', 'register accesses that failed', host=host, method=method).inc()
+                raise
+
+    def _request(self, host, method, path, body, timeout):
+        reused = host in self.connections and self.connections[host].sock is not None
+
+        try:
+            return self._send(host, method, path, body, timeout)
+        except (socket.error, httplib.HTTPException) as e:
+            self.drop(host)
+            if not reused:
+                raise IOError(e)
+
+        self.stats['retries'] += 1
+        metrics.counter('stepper_retries_total', 'register accesses retried on a fresh connection', host=host).inc()
+        try:
+            return self._send(host, method, path, body, timeout)
+        except (socket.error, httplib.HTTPException) as e:
+            self.drop(host)
+            raise IOError(e)
+
+    def drop(self, host):
+        '''close the connection to host, the next request opens a new one'''
+        conn = self.connections.pop(host, None)
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        for host in list(self.connections):
+            self.drop(host)
+
+    def get_reuse_ratio(self):
+        '''fraction of requests that went out on an already open connection'''
+        sent = self.stats['connections'] + self.stats['reused']
+        return float(self.stats['reused']) / sent if sent else 0.0
+
+
 class StepperComms:
     # type matters; only listed in documentation or object directory
 
@@ -30,10 +137,17 @@ class StepperComms:
     # Unsigned 8 bit (uchar)
     typeU08 = 5
 
+    def __init__(self, http10=False):
+        self.transport = StepperTransport(http10=http10)
+
     def make_url(self, host, index, subindex):
-        url = "http://%s/od/%04X/%02X" % (host, index, subindex)
+        url = "http://%s%s" % (host, self.make_path(index, subindex))
         return url
 
+    def make_path(self, index, subindex):
+        path = "/od/%04X/%02X" % (index, subindex)
+        return path
+
     def make_value(self, value, type):
         svalue = ""
         if(type == self.typeS16):
@@ -64,41 +178,23 @@ class StepperComms:
         return svalue
 
     def set_register(self, host, index, subindex, value, type):
-        # Create URL scheme
-        url = self.make_url(host, index, subindex)
-
-        # Motor controller needs 1.0 not 1.0
-        # httplib.HTTPConnection._http_vsn = 10
-        # httplib.HTTPConnection._http_vsn_str = 'HTTP/1.0'
+        # Create path on the controller, the connection to host is kept open
+        path = self.make_path(index, subindex)
 
         # value needs to be in Hex with quotes
         svalue = self.make_value(value, type)
-        request = urllib2.Request(url)
-        # Add to request
-        request.add_data(svalue)
-        # Send to server
-        response = urllib2.urlopen(request)
+        # Send to server as the request body
         # response empty on success, check?
-        # html = response.read()
-        # print html
-        response.close()
+        self.transport.request(host, 'POST', path, svalue)
         # Recommends wait after every command
         time.sleep(.01)
 
     def get_register(self, host, index, subindex):
-        # Create URL scheme
-        url = self.make_url(host, index, subindex)
-
-        # Motor controller needs 1.0 not 1.0
-        # httplib.HTTPConnection._http_vsn = 10
-        # httplib.HTTPConnection._http_vsn_str = 'HTTP/1.0'
+        # Create path on the controller, the connection to host is kept open
+        path = self.make_path(index, subindex)
 
-        # on get, open url
-        response = urllib2.urlopen(url)
         # Get response (should be hex in quotes)
-        html = response.read()
-        # print html
-        response.close()
+        html = self.transport.request(host, 'GET', path)
         # value is retruns in quotes, strip
         svalue = html.strip('"')
         # Convert to actual int
@@ -108,68 +204,409 @@ class StepperComms:
         return value
 
     def check_up(self, host):
-        url = "http://%s/od/6041/00" % (host)
         try:
             # see if the server is up, timeout 1 second
-            ret = urllib2.urlopen(url, data=None, timeout=1.0)
+            self.transport.request(host, 'GET', self.make_path(0x6041, 0x00), timeout=1.0)
             return 1
         except IOError:
             print("Host {} is down: {}".format(host, datetime.today()))
             sys.stdout.flush()
             return 0
 
-
-class StepperControl:
-        ControlWord = 0x6040
-        StatusWord = 0x6041
-        ProfileVelocity = 0x6081
-        TargetPosition = 0x607A
-        Inputs = 0x60FD
-        ActualPosition = 0x6064
-        OperatingMode = 0x6060
-        InputVoltageRange = 0x3240
-        ClosedLoop = 0x3202
-
-        def __init__(self, host):
-            self.host = host
-            self.connected = 0
-            # Create comms
-            self.comms = StepperComms()
-            self.check_controller()
-            self.initialize_controller()
+    def print_stats(self):
+        '''debug purposes only'''
+        stats = self.transport.stats
+        print('requests: {}'.format(stats['requests']))
+        print('connections opened: {}'.format(stats['connections']))
+        print('connections reused: {}'.format(stats['reused']))
+        print('retries on a fresh connection: {}'.format(stats['retries']))
+        print('reuse ratio: {:.3f}'.format(self.transport.get_reuse_ratio()))
+
+
+class Liveness:
+    '''
+    tracks whether a controller is up from the register accesses we already make.
+    any successful access is a heartbeat, so the controller only needs probing
+    after it has been idle for longer than ttl seconds, or after an access failed.
+    while it is down, probes back off exponentially from min_backoff to max_backoff.
+    '''
+
+    def __init__(self, ttl=5.0, min_backoff=0.1, max_backoff=10.0):
+        self.ttl = ttl
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.last_heartbeat = None
+        self.failed = False
+
+    def beat(self):
+        self.last_heartbeat = time.time()
+        self.failed = False
+
+    def fail(self):
+        self.failed = True
+
+    def needs_probe(self):
+        if self.failed or self.last_heartbeat is None:
+            return True
+
+        return time.time() - self.last_heartbeat > self.ttl
+
+    def backoff(self):
+        '''yield how long to wait before each successive probe of a controller that is down'''
+        delay = self.min_backoff
+        while True:
+            yield delay
+            delay = min(delay * 2, self.max_backoff)
+
+
+class Registers:
+    ControlWord = 0x6040
+    StatusWord = 0x6041
+    ProfileVelocity = 0x6081
+    TargetPosition = 0x607A
+    Inputs = 0x60FD
+    ActualPosition = 0x6064
+    OperatingMode = 0x6060
+    InputVoltageRange = 0x3240
+    ClosedLoop = 0x3202
+
+    # Registers only written when their value changes, see set_register.
+    # ControlWord and TargetPosition are never skipped, they're commands,
+    # not configuration: every write is a state transition or a move.
+    ShadowedRegisters = (ProfileVelocity, InputVoltageRange, OperatingMode)
+
+
+class StepperControl(Registers):
+        '''
+        blocking interface to one controller. every command is run by an
+        AsyncStepperControl, which holds the connection, the register shadow and
+        liveness, and waits for its result. pass core to share a controller that
+        is already running, i.e. AsyncStepperControl.control, otherwise one is
+        started for host, speaking HTTP/1.0 if http10 is set.
+        '''
+
+        def __init__(self, host=None, liveness_ttl=5.0, core=None, http10=False):
+            if core is None:
+                core = AsyncStepperControl(host, liveness_ttl=liveness_ttl, http10=http10)
+                core.ready.result()
+            self.core = core
+            self.host = core.host
+            self.comms = core.comms
+
+        # State lives in the core, shared with every other view of it
+        @property
+        def liveness(self):
+            return self.core.liveness
+
+        @property
+        def shadow(self):
+            return self.core.shadow
+
+        @property
+        def writes_saved(self):
+            return self.core.writes_saved
+
+        @property
+        def down_count(self):
+            return self.core.down_count
+
+        def set_register(self, index, subindex, value, type):
+            return self.core.set_register(index, subindex, value, type).result()
+
+        def get_register(self, index, subindex):
+            return self.core.get_register(index, subindex).result()
+
+        def invalidate_shadow(self):
+            return self.core.invalidate_shadow().result()
 
         def initialize_controller(self):
-            # Set Input 1 to 24 Volt Range
-            self.comms.set_register(self.host, self.InputVoltageRange, 0x06, 1, self.comms.typeU32)
-            # Set As Position Mode
-            self.comms.set_register(self.host, self.OperatingMode, 0x00, 1, self.comms.typeU08)
-
-            # Initial Move to set up states
-            self.move_relative(0, 0)
-
-            # Always come up in halt
-            # self.halt()
+            return self.core.initialize_controller().result()
 
         def check_controller(self):
-            count = 0
-            while(self.comms.check_up(self.host) == 0):
-                count += 1
-            # If it ever failed, assume it was down
-            # and reinitialize
-            if count > 0:
-                self.initialize_controller()
+            return self.core.check_controller().result()
 
         # Speed between 0 and 250 (positive only)
         # Already ramps up and down, max speed
         # Position negative and positive
         def move_relative(self, Speed, Steps):
+            return self.core.move_relative(Speed, Steps).result()
+
+        # Halt and clear everything?
+        def halt(self):
+            return self.core.halt().result()
+
+        def check_reached(self):
+            return self.core.check_reached().result()
+
+        def check_flag(self):
+            return self.core.check_flag().result()
+
+        def get_status(self):
+            return self.core.get_status().result()
+
+        def get_closed(self):
+            return self.core.get_closed().result()
+
+        def close(self):
+            self.core.close()
+
+
+class Pending:
+    '''
+    result of a command running on an AsyncStepperControl worker thread.
+    result() blocks until it is done and returns its value, or raises its error.
+    '''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def finish(self, value=None, error=None):
+        self.value = value
+        self.error = error
+        self.done.set()
+
+    def is_done(self):
+        return self.done.is_set()
+
+    def result(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise RuntimeError('timed out waiting for controller')
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def gather(*pendings):
+    '''wait for every pending command and return their results in order'''
+    return [pending.result() for pending in pendings]
+
+
+class AsyncStepperControl(Registers):
+    '''
+    drives one controller from its own worker thread, so several controllers can
+    be commanded and polled at the same time. every command returns a Pending
+    right away instead of blocking; commands for one controller run in order,
+    one at a time, over its one connection. only the worker thread ever touches
+    the connection, the register shadow or liveness. control is a StepperControl
+    that blocks on the commands of this one.
+
+    the controller is connected and initialized on the worker thread too, so
+    constructing several of these brings them up in parallel. wait on ready
+    before sending commands. set http10 to speak HTTP/1.0 to the controller, see
+    StepperTransport.
+    '''
+
+    def __init__(self, host, liveness_ttl=5.0, http10=False):
+        self.host = host
+        self.comms = StepperComms(http10=http10)
+        # Only probe the controller when we haven't heard from it lately
+        self.liveness = Liveness(ttl=liveness_ttl)
+        self.down_count = 0
+        # Last value written to each register, as sent to the controller
+        self.shadow = {}
+        self.writes_saved = 0
+        # Set while reinitializing after a failed access, see _access
+        self.retrying = False
+        self.control = StepperControl(core=self)
+        self.commands = Queue.Queue()
+        self.worker = threading.Thread(target=self._work, name='stepper-{}'.format(host))
+        self.worker.daemon = True
+        self.worker.start()
+        self.ready = self.submit(self._connect)
+
+    def _connect(self):
+        self._check_controller()
+        self._initialize_controller()
+        return self.control
+
+    def _work(self):
+        while True:
+            func, args, pending = self.commands.get()
+            if func is None:
+                break
+            self._run(func, args, pending)
+        # Only the worker ever touches the connection
+        self.comms.transport.close()
+
+    def _run(self, func, args, pending):
+        try:
+            pending.finish(value=func(*args))
+        except Exception as e:
+            pending.finish(error=e)
+
+    def submit(self, func, *args):
+        '''
+        run func(*args) on the worker thread, after any commands already queued.
+        from the worker thread itself, i.e. inside a submitted function, func
+        runs right away, since the worker can't wait for itself.
+        '''
+        pending = Pending()
+        if threading.current_thread() is self.worker:
+            self._run(func, args, pending)
+        else:
+            self.commands.put((func, args, pending))
+        return pending
+
+    def set_register(self, index, subindex, value, type):
+        return self.submit(self._set_register, index, subindex, value, type)
+
+    def get_register(self, index, subindex):
+        return self.submit(self._get_register, index, subindex)
+
+    def invalidate_shadow(self):
+        return self.submit(self._invalidate_shadow)
+
+    def initialize_controller(self):
+        return self.submit(self._initialize_controller)
+
+    def check_controller(self):
+        return self.submit(self._check_controller)
+
+    def move_relative(self, Speed, Steps):
+        return self.submit(self._move_relative, Speed, Steps)
+
+    def halt(self):
+        return self.submit(self._halt)
+
+    def check_reached(self):
+        return self.submit(self._check_reached)
+
+    def check_flag(self):
+        return self.submit(self._check_flag)
+
+    def get_status(self):
+        return self.submit(self._get_status)
+
+    def get_closed(self):
+        return self.submit(self._get_closed)
+
+    def close(self):
+        '''stop the worker thread once everything queued has run, and close the connection'''
+        self.commands.put((None, None, None))
+        self.worker.join()
+
+    # Everything below runs on the worker thread
+
+    def _set_register(self, index, subindex, value, type):
+        # Skip the write (and the sleep after it) if the controller
+        # already holds this value
+        if index not in self.ShadowedRegisters:
+            self._access(self.comms.set_register, index, subindex, value, type)
+            return
+
+        key = (index, subindex)
+        svalue = self.comms.make_value(value, type)
+        if self.shadow.get(key) == svalue:
+            self.writes_saved += 1
+            metrics.counter('stepper_writes_saved_total', 'register writes skipped, the controller already had the value', host=self.host).inc()
+            return
+
+        # Unknown until the write goes through
+        self.shadow.pop(key, None)
+        self._access(self.comms.set_register, index, subindex, value, type)
+        self.shadow[key] = svalue
+
+    def _get_register(self, index, subindex):
+        return self._access(self.comms.get_register, index, subindex)
+
+    def _access(self, func, *args):
+        try:
+            return self._try_access(func, *args)
+        except IOError:
+            # Already waiting for it to come back, let that probe handle it
+            if self.retrying:
+                raise
+        # Wait for the controller to answer again, reinitialize it and
+        # try once more, like the probe before every command would
+        self.retrying = True
+        try:
+            while True:
+                try:
+                    self._check_controller()
+                    break
+                except IOError:
+                    # Went down again while being reinitialized
+                    continue
+        finally:
+            self.retrying = False
+        return self._try_access(func, *args)
+
+    def _try_access(self, func, *args):
+        # Any register access that fails, or only gets through on a fresh
+        # connection, means the controller may have been reset, so
+        # nothing in the shadow can be trusted any more
+        retries = self.comms.transport.stats['retries']
+        try:
+            value = func(self.host, *args)
+        except IOError:
+            self.liveness.fail()
+            self._invalidate_shadow()
+            raise
+        if self.comms.transport.stats['retries'] != retries:
+            self._invalidate_shadow()
+        self.liveness.beat()
+        return value
+
+    def _invalidate_shadow(self):
+        self.shadow.clear()
+
+    def _initialize_controller(self):
+        # Controller may have lost everything, write it all again
+        self._invalidate_shadow()
+
+        # Set Input 1 to 24 Volt Range
+        self._set_register(self.InputVoltageRange, 0x06, 1, self.comms.typeU32)
+        # Set As Position Mode
+        self._set_register(self.OperatingMode, 0x00, 1, self.comms.typeU08)
+
+        # Initial Move to set up states
+        self._move_relative(0, 0)
+
+        # Always come up in halt
+        # self._halt()
+
+    def _check_controller(self):
+        # Any register access that worked recently says it's up
+        if not self.liveness.needs_probe():
+            return
+
+        # An access failed since we last heard from it, so it may
+        # have been reset even if it answers the first probe
+        recovering = self.liveness.failed
+        # Anything could have happened since we last heard from it,
+        # don't trust what we think it holds
+        self._invalidate_shadow()
+        count = 0
+        started = time.time()
+        backoff = self.liveness.backoff()
+        while(self.comms.check_up(self.host) == 0):
+            count += 1
+            self.liveness.fail()
+            # Don't hammer a controller that is down
+            time.sleep(next(backoff))
+        self.liveness.beat()
+        # If a probe failed, it was down
+        if count > 0:
+            self.down_count += 1
+            metrics.counter('stepper_controller_down_total', 'times a controller was found down', host=self.host).inc()
+            metrics.histogram('stepper_controller_down_seconds', 'how long a controller was down until it answered again', host=self.host).observe(time.time() - started)
+        # Either way it may have lost everything, reinitialize. So has
+        # one that was reset while we weren't talking to it, it comes
+        # back up out of position mode
+        if count > 0 or recovering or self._get_register(self.OperatingMode, 0x00) != 1:
+            self._initialize_controller()
+
+    def _move_relative(self, Speed, Steps):
+        with metrics.histogram('stepper_move_relative_seconds', 'time to start a move, all of its register writes', host=self.host).timer():
             # Always need to check if controller is up
-            self.check_controller()
+            self._check_controller()
 
             # Set speed as unsigned number
-            self.comms.set_register(self.host, self.ProfileVelocity, 0, Speed, self.comms.typeU32)
+            self._set_register(self.ProfileVelocity, 0, Speed, self.comms.typeU32)
             # Set relative position in ticks (25000 = 1 revolution of motor shaft)
-            self.comms.set_register(self.host, self.TargetPosition, 0, Steps, self.comms.typeS32)
+            self._set_register(self.TargetPosition, 0, Steps, self.comms.typeS32)
 
             # Bit 4 start
             # Bit 5 immediate
@@ -179,63 +616,62 @@ class StepperControl:
             # must be moved to completely
 
             # Quick Stop, Enable Voltage
-            self.comms.set_register(self.host, self.ControlWord, 0, 0x06, self.comms.typeU16)
+            self._set_register(self.ControlWord, 0, 0x06, self.comms.typeU16)
             # Switch On
-            self.comms.set_register(self.host, self.ControlWord, 0, 0x07, self.comms.typeU16)
+            self._set_register(self.ControlWord, 0, 0x07, self.comms.typeU16)
             # Enable Operation, Set Relative Motion
-            self.comms.set_register(self.host, self.ControlWord, 0, 0x4F, self.comms.typeU16)
+            self._set_register(self.ControlWord, 0, 0x4F, self.comms.typeU16)
             # Start
-            self.comms.set_register(self.host, self.ControlWord, 0, 0x5F, self.comms.typeU16)
+            self._set_register(self.ControlWord, 0, 0x5F, self.comms.typeU16)
 
-        # Halt and clear everything?
-        def halt(self):
-            # Always need to check if controller is up
-            self.check_controller()
+    def _halt(self):
+        # Always need to check if controller is up
+        self._check_controller()
 
-            # Halt Free Spin
-            # self.comms.set_register(self.host, self.ControlWord, 0, 0x1000, self.comms.typeU16)
-            # Halt powered?
-            # self.comms.set_register(self.host, self.ControlWord, 0, 0x1007, self.comms.typeU16)
+        # Halt Free Spin
+        # self._set_register(self.ControlWord, 0, 0x1000, self.comms.typeU16)
+        # Halt powered?
+        # self._set_register(self.ControlWord, 0, 0x1007, self.comms.typeU16)
 
-            # Cancel move
-            self.comms.set_register(self.host, self.ControlWord, 0, 0x0007, self.comms.typeU16)
-            # Hold
-            self.comms.set_register(self.host, self.ControlWord, 0, 0x000F, self.comms.typeU16)
+        # Cancel move
+        self._set_register(self.ControlWord, 0, 0x0007, self.comms.typeU16)
+        # Hold
+        self._set_register(self.ControlWord, 0, 0x000F, self.comms.typeU16)
 
-        def check_reached(self):
-            # Always need to check if controller is up
-            self.check_controller()
+    def _check_reached(self):
+        # Always need to check if controller is up
+        self._check_controller()
 
-            # In status? 0x6041
-            # Bit 10 Target Reached
-            # Bit 12 Point Acknowledged
+        # In status? 0x6041
+        # Bit 10 Target Reached
+        # Bit 12 Point Acknowledged
 
-            reach = self.comms.get_register(self.host, self.StatusWord, 0)
-            if(reach & 0x0400):
-                return 1
-            else:
-                return 0
+        reach = self._get_register(self.StatusWord, 0)
+        if(reach & 0x0400):
+            return 1
+        else:
+            return 0
 
-        def check_flag(self):
-            # Always need to check if controller is up
-            self.check_controller()
+    def _check_flag(self):
+        # Always need to check if controller is up
+        self._check_controller()
 
-            flag = self.comms.get_register(self.host, self.Inputs, 0)
-            # print flag
-            return 1 if(flag & 0x10000 == 0) else 0
+        flag = self._get_register(self.Inputs, 0)
+        # print flag
+        return 1 if(flag & 0x10000 == 0) else 0
 
-        def get_status(self):
-            # Always need to check if controller is up
-            self.check_controller()
+    def _get_status(self):
+        # Always need to check if controller is up
+        self._check_controller()
 
-            v = self.comms.get_register(self.host, self.StatusWord, 0)
-            # print "%04X" % (v)
-            print(v)
+        v = self._get_register(self.StatusWord, 0)
+        # print "%04X" % (v)
+        print(v)
 
-        def get_closed(self):
-            # Always need to check if controller is up
-            self.check_controller()
+    def _get_closed(self):
+        # Always need to check if controller is up
+        self._check_controller()
 
-            v = self.comms.get_register(self.host, self.ClosedLoop, 0)
-            # print "%04X" % (v)
-            print(v)
+        v = self._get_register(self.ClosedLoop, 0)
+        # print "%04X" % (v)
+        print(v)
@@ -0,0 +1,46 @@
+#!/usr/bin/python
+# shared fixtures, and the repo root on sys.path since it isn't a package
+# 10/18/26
+
+import os
+import sys
+import shutil
+import logging
+import pytest
+
+basepath = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, basepath)
+
+
+@pytest.fixture
+def sea_csv(tmpdir):
+    '''a copy of the sea level dataset, free to append to'''
+    from data import Data
+
+    path = str(tmpdir.join('sea.csv'))
+    shutil.copy(Data.paths['sea'], path)
+
+    return path
+
+
+@pytest.fixture
+def make_compute():
+    '''makes a Compute sized like main.py's kitchen, moved to steps_completed'''
+    from compute import Compute
+
+    def make_compute(steps_completed=0):
+        compute = Compute(target_diameter=Compute.diameter_after_half_paper_moved)
+        compute.update_position(steps_completed)
+        return compute
+
+    return make_compute
+
+
+@pytest.fixture
+def main_module():
+    '''main.py, with the logger it normally gets from configure_logger()'''
+    import main
+
+    main.logger = logging.getLogger('main')
+
+    return main
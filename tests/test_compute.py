@@ -0,0 +1,47 @@
+import pytest
+import numpy as np
+
+
+@pytest.mark.parametrize('bite', [4.0, 0.5, 0.001])
+def test_closed_form_matches_stepwise(make_compute, bite):
+    closed, stepwise = make_compute(), make_compute()
+
+    for i in range(100):
+        assert closed.calculate_steps_per_inches(inches_to_move=bite) == stepwise.calculate_steps_per_inches_stepwise(inches_to_move=bite)
+        assert closed.steps_completed == stepwise.steps_completed
+
+
+def test_closed_form_matches_stepwise_near_the_core(make_compute):
+    start = int(make_compute().total_steps_to_complete) - 10000
+    closed, stepwise = make_compute(start), make_compute(start)
+
+    for i in range(10):
+        assert closed.calculate_steps_per_inches() == stepwise.calculate_steps_per_inches_stepwise()
+
+
+@pytest.mark.parametrize('start', [0, 1234567])
+def test_steps_per_bites_matches_one_bite_at_a_time(make_compute, start):
+    bites = np.random.RandomState(start).uniform(0, 4, 500)
+    bites[::7] = 4.0
+    batch, single = make_compute(start), make_compute(start)
+
+    steps = batch.calculate_steps_per_bites(bites)
+
+    assert list(steps) == [single.calculate_steps_per_inches(inches_to_move=bite) for bite in bites]
+    assert batch.steps_completed == single.steps_completed
+
+
+def test_steps_per_bites_from_a_restored_checkpoint(make_compute):
+    compute = make_compute()
+    compute.calculate_steps_per_bites([4.0] * 10)
+    restored = make_compute()
+    restored.restore(compute.steps_completed, compute.total_inches_moved)
+
+    assert list(restored.calculate_steps_per_bites([4.0] * 5)) == [compute.calculate_steps_per_inches() for i in range(5)]
+
+
+def test_steps_per_bites_empty(make_compute):
+    compute = make_compute(1000)
+
+    assert len(compute.calculate_steps_per_bites([])) == 0
+    assert compute.steps_completed == 1000
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from timeit import default_timer
+from data import Data, discrete_integrals, percentages, normalize, translate_range
+
+
+def reference_data(y):
+    '''integrals, percentages, normalized and translated y the way Data computed them one point at a time'''
+    integrals = [np.trapz([y[i], y[i + 1]], dx=1) for i in range(len(y)) if i < len(y) - 1]
+    total = sum(integrals)
+    percents = [n / total for n in integrals]
+    data_min = min(y)
+    data_range = max(y) - data_min
+    normalized = [(n - data_min) / data_range for n in y]
+    translated = [-1.0 + (n * (1.0 - -1.0)) for n in normalized]
+
+    return integrals, percents, normalized, translated
+
+
+@pytest.mark.parametrize('art', sorted(Data.paths))
+def test_vectorized_math_matches_reference(art):
+    y = Data(data_path=Data.paths[art]).y
+    integrals = discrete_integrals(y)
+    results = (integrals, percentages(integrals), normalize(y), translate_range(normalize(y)))
+
+    for result, reference in zip(results, reference_data(y)):
+        assert np.array_equal(result, reference)
+
+
+def test_vectorized_math_scales_linearly():
+    def time_rows(num_rows):
+        y = np.random.RandomState(0).normal(0, 1, num_rows)
+        start = default_timer()
+        translate_range(normalize(y))
+        percentages(discrete_integrals(y))
+        return default_timer() - start
+
+    # 10x the rows should take about 10x as long, allow for noise
+    assert time_rows(10**6) / max(time_rows(10**5), 1e-9) < 30
+
+
+def test_cache_is_used_until_the_csv_changes(sea_csv):
+    parsed = Data(data_path=sea_csv)
+    cached = Data(data_path=sea_csv)
+
+    assert isinstance(cached.original_data, np.memmap)
+    assert np.array_equal(cached.original_data, parsed.original_data)
+
+    with open(sea_csv, 'a') as f:
+        f.write('3000,1.5\n')
+
+    assert len(Data(data_path=sea_csv).y) == len(parsed.y) + 1
+
+
+def test_extra_columns_are_ignored(sea_csv, tmpdir):
+    lines = open(sea_csv).read().splitlines()
+    path = str(tmpdir.join('extra.csv'))
+    with open(path, 'w') as f:
+        f.write('\n'.join([lines[0] + ',note'] + [line + ',x' for line in lines[1:] if line.strip()]) + '\n')
+
+    assert np.array_equal(Data(data_path=path).y, Data(data_path=sea_csv).y)
+
+
+def test_append_matches_loading_everything(sea_csv):
+    data = Data(data_path=sea_csv)
+    data.append([3000.0, 3001.0], [1.5, 2.5])
+    with open(sea_csv, 'a') as f:
+        f.write('3000,1.5\n3001,2.5\n')
+
+    loaded = Data(data_path=sea_csv)
+
+    assert np.array_equal(data.y, loaded.y)
+    assert data.integrals == loaded.integrals
+    assert data.total == loaded.total
+    assert np.array_equal(data.percents, loaded.percents)
+
+
+def test_refresh_reads_new_rows_only_once(sea_csv):
+    data = Data(data_path=sea_csv)
+    assert data.refresh() == 0
+
+    with open(sea_csv, 'a') as f:
+        f.write('3000,1.5\n3001,2.5\n')
+
+    assert data.refresh() == 2
+    assert data.refresh() == 0
+    assert np.array_equal(Data(data_path=sea_csv).y, data.y)
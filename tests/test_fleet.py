@@ -0,0 +1,26 @@
+import threading
+import pytest
+
+
+class FakePlan:
+    def close(self):
+        pass
+
+
+def test_fleet_exits_when_an_installation_stops(main_module, monkeypatch, tmpdir):
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(main_module, 'load_plan', lambda *args, **kwargs: FakePlan())
+    forever = threading.Event()
+
+    def run_installation(installation, args, **kwargs):
+        if installation['name'] == 'broken':
+            raise IOError('controller unreachable')
+        forever.wait()
+
+    monkeypatch.setattr(main_module, 'run_installation', run_installation)
+    installations = [{'name': 'fine', 'art': 'sea'}, {'name': 'broken', 'art': 'hot'}]
+
+    with pytest.raises(SystemExit) as exit:
+        main_module.run_fleet(installations, args=type('Args', (), {'sim_to': None}))
+    assert exit.value.code == 1
+    forever.set()
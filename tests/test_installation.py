@@ -0,0 +1,25 @@
+import pytest
+
+
+class FakeControl:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_controls_are_closed_when_a_run_fails(main_module, monkeypatch, tmpdir):
+    motors = main_module.Motors(FakeControl(), FakeControl())
+    monkeypatch.setattr(main_module, 'initialize_motors', lambda **kwargs: motors)
+
+    def load_plan(*args, **kwargs):
+        raise IOError('plan file unreadable')
+
+    monkeypatch.setattr(main_module, 'load_plan', load_plan)
+    config = {'name': 'sea', 'art': 'sea', 'feed_ip': '127.0.0.1', 'eat_ip': '127.0.0.1', 'feed_dir': -1}
+    args = type('Args', (), {'sim': 0, 'concurrent': False, 'profile': False})
+
+    with pytest.raises(IOError):
+        main_module.run_installation(config, args, tracker_path=str(tmpdir.join('move.db')))
+    assert all(motor.closed for motor in motors)
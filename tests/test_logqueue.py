@@ -0,0 +1,22 @@
+import logging
+import pytest
+from logqueue import RateLimitFilter, SampleFilter
+
+
+def make_record(level):
+    return logging.LogRecord('main', level, 'main.py', 42, 'polling', None, None)
+
+
+@pytest.mark.parametrize('make_filter', [lambda: RateLimitFilter(rate=0.001, burst=1), lambda: SampleFilter(every=10)])
+def test_polling_filters_only_limit_below_warning(make_filter):
+    polling = make_filter()
+
+    assert sum(polling.filter(make_record(logging.INFO)) for i in range(10)) == 1
+    assert all(polling.filter(make_record(level)) for level in [logging.WARNING, logging.ERROR] * 10)
+
+
+def test_level_can_be_given_by_name_as_in_log_yaml():
+    polling = RateLimitFilter(rate=0.001, burst=1, level='ERROR')
+
+    assert sum(polling.filter(make_record(logging.WARNING)) for i in range(10)) == 1
+    assert polling.filter(make_record(logging.ERROR))
@@ -0,0 +1,107 @@
+import struct
+import pytest
+import numpy as np
+from compute import Compute
+from data import Data
+from schedule import compile_schedule, schedule_from_plan
+import plan as plan_module
+from plan import Plan, write_plan, load_plan, compute_constants, header, max_art_length
+
+target_diameter = Compute.diameter_after_half_paper_moved
+digest = 'a' * 40
+
+
+@pytest.fixture(scope='module')
+def schedule():
+    return compile_schedule(Data(data_path=Data.paths['sea']), Compute(target_diameter=target_diameter))
+
+
+@pytest.fixture
+def plan_path(tmpdir, schedule):
+    path = str(tmpdir.join('plan.bin'))
+    write_plan(path, 'sea', digest, compute_constants(target_diameter), schedule)
+
+    return path
+
+
+def test_round_trip(plan_path, schedule):
+    plan = Plan(plan_path)
+
+    assert len(plan) == len(schedule)
+    assert plan.art == 'sea'
+    assert plan.is_valid('sea', digest, compute_constants(target_diameter))
+    assert plan[0] == tuple(schedule[0].tolist())
+    assert plan[-1] == tuple(schedule[-1].tolist())
+    assert schedule_from_plan(plan).tobytes() == schedule.tobytes()
+    plan.close()
+
+
+def test_long_art_names_survive(tmpdir, schedule):
+    path = str(tmpdir.join('plan.bin'))
+    art = 'x' * max_art_length
+    write_plan(path, art, digest, compute_constants(target_diameter), schedule[:10])
+
+    assert Plan(path).is_valid(art, digest, compute_constants(target_diameter))
+
+
+def test_too_long_art_name_is_refused(tmpdir, schedule):
+    with pytest.raises(ValueError):
+        write_plan(str(tmpdir.join('plan.bin')), 'x' * (max_art_length + 1), digest, compute_constants(target_diameter), schedule[:10])
+
+
+@pytest.mark.parametrize('art, plan_digest, diameter', [
+    ('hot', digest, target_diameter),
+    ('sea', 'b' * 40, target_diameter),
+    ('sea', digest, Compute.core_diameter),
+])
+def test_header_mismatch_is_invalid(plan_path, art, plan_digest, diameter):
+    assert not Plan(plan_path).is_valid(art, plan_digest, compute_constants(diameter))
+
+
+def test_other_version_is_invalid(plan_path, monkeypatch):
+    monkeypatch.setattr(plan_module, 'version', plan_module.version + 1)
+
+    assert not Plan(plan_path).is_valid('sea', digest, compute_constants(target_diameter))
+
+
+def test_truncated_plan_is_invalid(plan_path):
+    with open(plan_path, 'r+b') as f:
+        f.truncate(header.size + 100)
+
+    assert not Plan(plan_path).is_valid('sea', digest, compute_constants(target_diameter))
+
+
+def test_header_only_is_unreadable(tmpdir):
+    path = str(tmpdir.join('plan.bin'))
+    with open(path, 'wb') as f:
+        f.write(b'SCRLPLAN')
+
+    with pytest.raises(struct.error):
+        Plan(path)
+
+
+def test_find_next(plan_path, schedule):
+    plan = Plan(plan_path)
+    first_bites = np.flatnonzero(schedule['bite'] == 0)
+
+    assert plan.find_next(0.0) == 0
+    # right after a finished portion is the first bite of the next one
+    assert plan.find_next(schedule['position'][first_bites[5] - 1]) == first_bites[5]
+    # part way into a portion still starts it from its first bite
+    assert plan.find_next(schedule['position'][first_bites[5]] - 0.5) == first_bites[5]
+    assert plan.find_next(schedule['position'][-1]) == len(plan)
+
+
+def test_load_plan_recompiles_when_inputs_change(tmpdir, sea_csv):
+    path = str(tmpdir.join('plan.bin'))
+
+    first = load_plan(path, 'sea', sea_csv)
+    num_bites = len(first)
+    first.close()
+    with open(sea_csv, 'a') as f:
+        f.write('3000,50.0\n')
+    second = load_plan(path, 'sea', sea_csv)
+
+    assert len(second) != num_bites
+    assert load_plan(path, 'sea', sea_csv).digest == second.digest
+    assert load_plan(path, 'sea', sea_csv, resample='linear').digest != second.digest
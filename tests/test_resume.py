@@ -0,0 +1,145 @@
+import pytest
+from datetime import datetime
+from plan import load_plan
+from sqltrack import Tracker, Checkpoint
+
+
+@pytest.fixture
+def plan(tmpdir, sea_csv):
+    plan = load_plan(str(tmpdir.join('plan.bin')), 'sea', sea_csv)
+    yield plan
+    plan.close()
+
+
+@pytest.fixture
+def tracker_path(tmpdir):
+    return str(tmpdir.join('move.db'))
+
+
+def eat(plan, tracker, start, stop):
+    '''journal bites start to stop the way main.run_installation() does'''
+    for index in range(start, stop):
+        bite = plan[index]
+        tracker.add_bite(datetime.today(), Checkpoint(index, bite.steps, bite.steps_completed, bite.inches_moved))
+        if bite.bite == bite.num_bites - 1:
+            tracker.add_move(datetime.today(), bite.position)
+
+
+def test_tracker_replays_its_journal(plan, tracker_path):
+    tracker = Tracker(path=tracker_path)
+    assert tracker.get_last_position() == 0.0
+    assert tracker.get_last_bite() is None
+    eat(plan, tracker, 0, 10)
+    tracker.close()
+
+    tracker = Tracker(path=tracker_path)
+
+    assert tracker.get_last_position() == max(plan[index].position for index in range(10) if plan[index].bite == plan[index].num_bites - 1)
+    assert tracker.get_last_bite() == Checkpoint(9, plan[9].steps, plan[9].steps_completed, plan[9].inches_moved)
+    tracker.close()
+
+
+def test_tracker_loses_at_most_an_uncommitted_group(tracker_path):
+    tracker = Tracker(path=tracker_path, commit_every=3)
+    for index in range(5):
+        tracker.add_bite(datetime.today(), Checkpoint(index, 100, 100 * (index + 1), 1.5 * (index + 1)))
+
+    # what a restart would see if the power went out now
+    crashed = Tracker(path=tracker_path)
+
+    assert crashed.get_last_bite().bite == 2
+    crashed.close()
+    tracker.close()
+
+
+def test_find_start_mid_portion(main_module, make_compute, plan, tracker_path):
+    tracker = Tracker(path=tracker_path)
+    eat(plan, tracker, 0, plan[0].num_bites + 1)
+    kitchen = make_compute()
+
+    start = main_module.find_start(plan, tracker, kitchen)
+
+    assert start == plan[0].num_bites + 1
+    assert plan[start].bite == 1
+    assert (kitchen.steps_completed, kitchen.total_inches_moved) == (plan[start - 1].steps_completed, plan[start - 1].inches_moved)
+    # the next bite comes out the same as in the plan
+    assert kitchen.calculate_steps_per_inches(inches_to_move=plan[start].inches) == plan[start].steps
+    tracker.close()
+
+
+def test_find_start_ignores_a_journal_from_another_plan(main_module, make_compute, plan, tracker_path):
+    tracker = Tracker(path=tracker_path)
+    eat(plan, tracker, 0, plan[0].num_bites)
+    bite = plan[plan[0].num_bites]
+    tracker.add_bite(datetime.today(), Checkpoint(plan[0].num_bites, bite.steps, bite.steps_completed + 1, bite.inches_moved))
+
+    # back to the start of the portion the checkpoint is in
+    assert main_module.find_start(plan, tracker, make_compute()) == plan[0].num_bites
+    tracker.close()
+
+
+def test_find_start_after_a_finished_portion(main_module, make_compute, plan, tracker_path):
+    tracker = Tracker(path=tracker_path)
+    eat(plan, tracker, 0, plan[0].num_bites)
+    kitchen = make_compute()
+
+    start = main_module.find_start(plan, tracker, kitchen)
+
+    assert start == plan[0].num_bites
+    assert plan[start].portion == 1 and plan[start].bite == 0
+    assert kitchen.steps_completed == plan[start - 1].steps_completed
+    tracker.close()
+
+
+def test_find_start_far_into_the_plan(main_module, make_compute, plan, tracker_path):
+    tracker = Tracker(path=tracker_path)
+    last = len(plan) // 2
+    while plan[last].bite != plan[last].num_bites - 1:
+        last += 1
+    tracker.add_move(datetime.today(), plan[last].position)
+    kitchen = make_compute()
+
+    start = main_module.find_start(plan, tracker, kitchen)
+
+    assert start == last + 1
+    # the roll is put back in closed form, as if every bite before it had been eaten
+    assert kitchen.steps_completed == plan[last].steps_completed
+    assert kitchen.calculate_steps_per_inches(inches_to_move=plan[start].inches) == plan[start].steps
+    tracker.close()
+
+
+def test_find_start_on_a_new_journal(main_module, make_compute, plan, tracker_path):
+    tracker = Tracker(path=tracker_path)
+    kitchen = make_compute()
+
+    assert main_module.find_start(plan, tracker, kitchen) == 0
+    assert kitchen.steps_completed == 0
+    tracker.close()
+
+
+@pytest.mark.parametrize('bites_into_meal', [0, 1])
+def test_restart_after_new_data_keeps_the_roll_where_it_was(main_module, make_compute, tmpdir, sea_csv, tracker_path, bites_into_meal):
+    plan_path = str(tmpdir.join('plan.bin'))
+    tracker = Tracker(path=tracker_path)
+    keep = lambda old: main_module.get_started_meals(old, tracker)
+    plan = load_plan(plan_path, 'sea', sea_csv, keep=keep)
+    # every bite of meals 0-2, and maybe some of meal 3
+    last = max(index for index in range(len(plan)) if plan[index].meal == 2) + bites_into_meal
+    eat(plan, tracker, 0, last + 1)
+    before = [plan[index] for index in range(len(plan)) if plan[index].meal <= plan[last].meal]
+    num_meals = plan[-1].meal + 1
+    plan.close()
+
+    # the data changed while we were down
+    with open(sea_csv, 'a') as f:
+        f.write('3000,50.0\n')
+    plan = load_plan(plan_path, 'sea', sea_csv, keep=keep)
+    kitchen = make_compute()
+    start = main_module.find_start(plan, tracker, kitchen)
+
+    assert [plan[index] for index in range(len(before))] == before
+    assert plan[-1].meal + 1 == num_meals + 1
+    assert start == last + 1
+    assert (kitchen.steps_completed, kitchen.total_inches_moved) == (plan[last].steps_completed, plan[last].inches_moved)
+    plan.close()
+    tracker.close()
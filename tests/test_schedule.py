@@ -0,0 +1,49 @@
+import numpy as np
+from data import Data
+from schedule import compile_schedule, meal_delta, split_into_bites, portion_sizes
+
+
+def test_split_into_bites():
+    bites_per_portion, inches = split_into_bites(np.array([9.5, 4.0, 1.0]))
+
+    assert list(bites_per_portion) == [3, 2, 1]
+    assert list(inches) == [4.0, 4.0, 1.5, 4.0, 0.0, 1.0]
+
+
+def test_schedule_matches_one_bite_at_a_time(make_compute):
+    data = Data(data_path=Data.paths['sea'])
+    schedule = compile_schedule(data, make_compute())
+    compute = make_compute()
+
+    for bite in schedule[:300]:
+        assert compute.calculate_steps_per_inches(inches_to_move=bite['inches']) == bite['steps']
+        assert compute.steps_completed == bite['steps_completed']
+
+    meal_inches, portions_per_meal = portion_sizes(data.percents, compute.total_inches_to_move, compute.total_num_movements)
+    assert np.isclose(schedule['position'][-1], meal_inches.sum() * portions_per_meal)
+
+
+def test_recompiling_keeps_eaten_meals(make_compute, sea_csv):
+    old = compile_schedule(Data(data_path=sea_csv), make_compute())
+    eaten = old[old['meal'] < 5]
+    data = Data(data_path=sea_csv)
+    data.append(data.x[-1] + 1, data.y[-1] * 2)
+
+    new = compile_schedule(data, make_compute(), eaten=eaten)
+
+    assert new[:len(eaten)].tobytes() == eaten.tobytes()
+    assert new['meal'][len(eaten)] == 5 and new['bite'][len(eaten)] == 0
+    assert new['meal'][-1] == len(data.percents) - 1
+    # the rest of the paper is shared out over the meals left
+    assert np.isclose(new['position'][-1], old['position'][-1])
+    # and they carry on from where the roll was left
+    compute = make_compute()
+    compute.restore(int(eaten['steps_completed'][-1]), float(eaten['inches_moved'][-1]))
+    for bite in new[len(eaten):len(eaten) + 100]:
+        assert compute.calculate_steps_per_inches(inches_to_move=bite['inches']) == bite['steps']
+
+
+def test_meal_delta_only_reports_real_changes():
+    deltas = meal_delta([1.0, 2.0, 3.0, 0.1 + 0.2], [1.0, 2.5, 3.0, 0.3, 4.0], from_meal=1)
+
+    assert [(delta.meal, delta.old_inches, delta.new_inches) for delta in deltas] == [(1, 2.0, 2.5), (4, None, 4.0)]
@@ -0,0 +1,78 @@
+import time
+import pytest
+from emulator import EmulatorServer, Controller, Faults
+from stepperweblib import StepperControl
+
+
+@pytest.fixture
+def server():
+    server = EmulatorServer(('127.0.0.1', 0), Controller(time_scale=1000), Faults()).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def control(server):
+    control = StepperControl(server.host)
+    yield control
+    control.close()
+
+
+def test_controller_going_down_mid_poll_is_waited_out(server, control):
+    control.move_relative(250, -500)
+    # it comes back up having lost its configuration
+    server.faults.go_down(0.3)
+    server.controller.registers[(Controller.OperatingMode, 0)] = 0
+
+    while not control.check_reached():
+        pass
+
+    assert control.down_count == 1
+    assert server.controller.registers[(Controller.OperatingMode, 0)] == 1
+    control.move_relative(250, -500)
+    assert server.controller.moves >= 2
+
+
+def test_controller_going_down_before_a_write_is_waited_out(server, control):
+    server.faults.go_down(0.3)
+
+    control.move_relative(250, -500)
+
+    assert control.down_count == 1
+    assert server.controller.registers[(Controller.TargetPosition, 0)] == -500
+
+
+def test_http10_controls_talk_to_a_controller_that_closes_every_connection():
+    server = EmulatorServer(('127.0.0.1', 0), Controller(time_scale=1000), Faults(), http10=True).start()
+    control = StepperControl(server.host, http10=True)
+    try:
+        control.move_relative(250, -500)
+        while not control.check_reached():
+            pass
+
+        assert control.comms.transport.http10
+        assert server.controller.registers[(Controller.TargetPosition, 0)] == -500
+        assert control.comms.transport.stats['reused'] == 0
+    finally:
+        control.close()
+        server.stop()
+
+
+def test_controller_reset_while_idle_is_reinitialized(server):
+    control = StepperControl(server.host, liveness_ttl=0.05)
+    try:
+        control.move_relative(250, -500)
+        while not control.check_reached():
+            pass
+        # it answers the next probe straight away, but has lost everything
+        server.controller.registers[(Controller.OperatingMode, 0)] = 0
+        server.controller.registers[(Controller.ProfileVelocity, 0)] = 0
+        time.sleep(0.1)
+
+        control.move_relative(250, -500)
+
+        assert server.controller.registers[(Controller.OperatingMode, 0)] == 1
+        assert server.controller.registers[(Controller.ProfileVelocity, 0)] == 250
+        assert control.down_count == 0
+    finally:
+        control.close()